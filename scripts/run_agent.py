@@ -16,11 +16,14 @@ sys.path.insert(0, str(root_dir))
 from dotenv import load_dotenv
 from src.agent import create_agent, test_github_connection
 from src.token_monitor import TokenMonitor
-from src.cache import QueryCache
+from src.cache import QueryCache, SemanticQueryCache
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Saída do AgentExecutor ao atingir o limite de iterações/tempo (não vai para o cache)
+AGENT_STOPPED_PREFIX = "Agent stopped due to"
+
 
 def main():
     """Função principal para executar o agente."""
@@ -46,7 +49,7 @@ def main():
     
     # Testar conexão com GitHub
     print("🔌 Testando conexão com GitHub...")
-    if not test_github_connection(repo_owner, repo_name):
+    if not test_github_connection(repo_owner, repo_name, github_token):
         print("❌ Falha ao conectar com GitHub. Verifique o token.")
         return
     
@@ -55,7 +58,10 @@ def main():
     token_monitor = TokenMonitor(model_name=model_name)
     token_monitor.set_tokenizer(model_name)
     
-    cache = QueryCache(ttl_seconds=3600)
+    cache = QueryCache(ttl_seconds=3600, db_path="data/query_cache.db")
+    # Camada semântica é opcional: paráfrases reaproveitam respostas, ao custo de um embedding por pergunta
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes"):
+        cache = SemanticQueryCache(cache, ttl_seconds=3600)
     
     try:
         agent = create_agent(
@@ -72,58 +78,71 @@ def main():
     print("💬 Digite suas perguntas sobre o repositório (ou 'sair' para encerrar)")
     print("-" * 60)
     
-    while True:
-        try:
-            query = input("\n❓ Pergunta: ").strip()
-            
-            if not query:
-                continue
-            
-            if query.lower() in ['sair', 'exit', 'quit', 'q']:
-                print("\n👋 Encerrando...")
-                break
-            
-            # Verificar cache
-            cached_response = cache.get(query, repo_owner, repo_name)
-            if cached_response:
-                print("\n📦 Resposta (do cache):")
-                print(cached_response)
-                print("\n💡 Esta resposta foi recuperada do cache.")
-                continue
-            
-            # Executar agente
-            print("\n🔍 Processando...")
+    try:
+        while True:
             try:
-                response = agent.invoke({"input": query})
-                answer = response.get("output", "Sem resposta")
-                
-                print("\n📝 Resposta:")
-                print(answer)
+                query = input("\n❓ Pergunta: ").strip()
                 
-                # Salvar no cache
-                cache.set(query, repo_owner, repo_name, answer)
+                if not query:
+                    continue
                 
-                # Mostrar estatísticas de tokens
-                session_stats = token_monitor.get_session_stats()
-                print("\n📊 Estatísticas de Tokens:")
-                print(f"   Input: {session_stats['input_tokens']}")
-                print(f"   Output: {session_stats['output_tokens']}")
-                print(f"   Total: {session_stats['total_tokens']}")
-                print(f"   Queries: {session_stats['queries']}")
+                if query.lower() in ['sair', 'exit', 'quit', 'q']:
+                    print("\n👋 Encerrando...")
+                    break
                 
-                # Registrar query completa
-                token_monitor.log_query(query, answer)
+                # Verificar cache
+                cached_response = cache.get(query, repo_owner, repo_name)
+                if cached_response:
+                    print("\n📦 Resposta (do cache):")
+                    print(cached_response)
+                    print("\n💡 Esta resposta foi recuperada do cache.")
+                    continue
                 
-            except Exception as e:
-                print(f"\n❌ Erro ao processar: {e}")
-                print("Tente reformular sua pergunta.")
-        
-        except KeyboardInterrupt:
-            print("\n\n👋 Encerrando...")
-            break
-        except EOFError:
-            print("\n\n👋 Encerrando...")
-            break
+                # Executar agente
+                print("\n🔍 Processando...")
+                try:
+                    # Stream: mostra cada ferramenta acionada assim que o agente decide usá-la
+                    answer = None
+                    for chunk in agent.stream({"input": query}):
+                        for action in chunk.get("actions", []):
+                            print(f"   🔧 {action.tool}: {action.tool_input}")
+                        if "output" in chunk:
+                            answer = chunk["output"]
+                    # Respostas vazias ou interrompidas seriam repetidas do cache entre execuções
+                    cacheable = bool(answer) and not answer.startswith(AGENT_STOPPED_PREFIX)
+                    answer = answer or "Sem resposta"
+                    
+                    print("\n📝 Resposta:")
+                    print(answer)
+                    
+                    # Salvar no cache
+                    if cacheable:
+                        cache.set(query, repo_owner, repo_name, answer)
+                    
+                    # Mostrar estatísticas de tokens
+                    session_stats = token_monitor.get_session_stats()
+                    print("\n📊 Estatísticas de Tokens:")
+                    print(f"   Input: {session_stats['input_tokens']}")
+                    print(f"   Output: {session_stats['output_tokens']}")
+                    print(f"   Total: {session_stats['total_tokens']}")
+                    print(f"   Queries: {session_stats['queries']}")
+                    
+                    # Registrar query completa
+                    token_monitor.log_query(query, answer)
+                    
+                except Exception as e:
+                    print(f"\n❌ Erro ao processar: {e}")
+                    print("Tente reformular sua pergunta.")
+            
+            except KeyboardInterrupt:
+                print("\n\n👋 Encerrando...")
+                break
+            except EOFError:
+                print("\n\n👋 Encerrando...")
+                break
+    finally:
+        # Gravar os registros de uso pendentes mesmo se o loop for interrompido
+        token_monitor.close()
     
     # Estatísticas finais
     print("\n" + "=" * 60)
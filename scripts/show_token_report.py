@@ -2,8 +2,8 @@
 
 import os
 import sys
+import time
 from pathlib import Path
-from datetime import datetime, timedelta
 
 # Adicionar diretório raiz ao path
 root_dir = Path(__file__).parent.parent
@@ -66,7 +66,7 @@ def main():
     
     # Estatísticas por período (últimos 7 dias)
     print("📅 Estatísticas dos Últimos 7 Dias:")
-    seven_days_ago = (datetime.now() - timedelta(days=7)).isoformat()
+    seven_days_ago = int(time.time()) - 7 * 86400
     weekly_report = monitor.get_report(start_date=seven_days_ago)
     print(f"   Queries: {format_number(weekly_report['total_queries'])}")
     print(f"   Tokens: {format_number(weekly_report['total_tokens'])}")
@@ -74,7 +74,7 @@ def main():
     
     # Estatísticas por período (últimas 24 horas)
     print("📅 Estatísticas das Últimas 24 Horas:")
-    one_day_ago = (datetime.now() - timedelta(days=1)).isoformat()
+    one_day_ago = int(time.time()) - 86400
     daily_report = monitor.get_report(start_date=one_day_ago)
     print(f"   Queries: {format_number(daily_report['total_queries'])}")
     print(f"   Tokens: {format_number(daily_report['total_tokens'])}")
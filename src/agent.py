@@ -1,17 +1,64 @@
 """Agente LangChain para consultas em repositórios GitHub."""
 
+import functools
+import importlib.util
 import os
-from typing import Optional, List
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, List, Tuple
+import requests
 from dotenv import load_dotenv
+from pydantic import Field, PrivateAttr
 from langchain_classic.agents import AgentExecutor, create_react_agent
+from langchain_classic.agents.output_parsers import ReActSingleInputOutputParser
 from langchain_community.utilities.github import GitHubAPIWrapper
 from langchain_community.agent_toolkits.github.toolkit import GitHubToolkit
 
 
+# Pool compartilhado para buscar detalhes de issues/PRs em paralelo: as chamadas
+# à API do GitHub são limitadas pela rede, não pela CPU
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="github-prefetch")
+
+
+@functools.lru_cache(maxsize=8)
+def _get_repo(github_token: str, github_repository: str) -> Tuple[Any, Any]:
+    """
+    Cria (uma vez por token/repositório) o cliente do GitHub e busca o repositório.
+    
+    Args:
+        github_token: Token pessoal do GitHub
+        github_repository: Repositório no formato owner/repo
+        
+    Returns:
+        Tupla (Github, Repository) compartilhada entre os wrappers
+    """
+    from github import Github, Auth
+    
+    # per_page=100 reduz as páginas buscadas ao listar issues/PRs; o pool HTTP
+    # maior permite que as buscas em paralelo reutilizem conexões keep-alive
+    g = Github(auth=Auth.Token(github_token), per_page=100, retry=3, pool_size=16)
+    return g, g.get_repo(github_repository)
+
+
 class PersonalTokenGitHubAPIWrapper(GitHubAPIWrapper):
-    """Wrapper customizado que suporta tokens pessoais do GitHub."""
+    """
+    Wrapper customizado que suporta tokens pessoais do GitHub.
+    
+    Ao listar issues ou pull requests, os detalhes dos primeiros itens são
+    pré-carregados em paralelo, já que a próxima ação do agente costuma ser
+    abrir um deles ("Get Issue" / "Get Pull Request").
+    """
     
     github_token: Optional[str] = None
+    # Quantos itens de cada listagem têm os detalhes pré-carregados (0 desativa); cada
+    # item custa algumas chamadas REST (comentários/commits) do limite do token
+    prefetch_limit: int = Field(default_factory=lambda: int(os.getenv("GITHUB_PREFETCH_LIMIT", "3")))
+    # Segundos em que um pré-carregamento ainda é servido; depois disso os detalhes são buscados de novo
+    prefetch_ttl: float = 120.0
+    
+    # (tipo, número) -> (instante da busca em time.monotonic(), future)
+    _prefetched: Dict[Tuple[str, int], Tuple[float, Future]] = PrivateAttr(default_factory=dict)
     
     @classmethod
     def validate_environment(cls, values):
@@ -22,11 +69,7 @@ class PersonalTokenGitHubAPIWrapper(GitHubAPIWrapper):
         
         if github_token and not values.get("github_app_id"):
             # Usar token pessoal
-            from github import Github, Auth
-            
-            auth = Auth.Token(github_token)
-            g = Github(auth=auth)
-            repo = g.get_repo(github_repository)
+            g, repo = _get_repo(github_token, github_repository)
             
             values["github"] = g
             values["github_repo_instance"] = repo
@@ -41,6 +84,64 @@ class PersonalTokenGitHubAPIWrapper(GitHubAPIWrapper):
         else:
             # Usar validação padrão para GitHub Apps
             return super().validate_environment(values)
+    
+    def _prefetch(self, kind: str, fetch: Callable[[int], Any], numbers: List[int]):
+        """Agenda a busca dos detalhes dos primeiros itens listados."""
+        now = time.monotonic()
+        # Descartar pré-carregamentos vencidos, para que uma nova listagem busque dados atuais
+        for key in [key for key, (fetched_at, _) in self._prefetched.items()
+                    if now - fetched_at > self.prefetch_ttl]:
+            del self._prefetched[key]
+        
+        for number in numbers[:self.prefetch_limit]:
+            key = (kind, number)
+            if key not in self._prefetched:
+                self._prefetched[key] = (now, _PREFETCH_POOL.submit(fetch, number))
+        
+        # Descartar os pré-carregamentos mais antigos que nunca foram usados
+        while len(self._prefetched) > 4 * self.prefetch_limit:
+            self._prefetched.pop(next(iter(self._prefetched)))
+    
+    def _take_prefetched(self, kind: str, number: int) -> Optional[Any]:
+        """Retorna o resultado pré-carregado (uma única vez) ou None se indisponível ou vencido."""
+        entry = self._prefetched.pop((kind, number), None)
+        if entry is None:
+            return None
+        fetched_at, future = entry
+        if time.monotonic() - fetched_at > self.prefetch_ttl:
+            future.cancel()
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+    
+    def parse_issues(self, issues) -> List[dict]:
+        """Formata as issues e pré-carrega os detalhes das primeiras."""
+        parsed = super().parse_issues(issues)
+        self._prefetch("issue", super().get_issue, [issue["number"] for issue in parsed])
+        return parsed
+    
+    def parse_pull_requests(self, pull_requests) -> List[dict]:
+        """Formata os pull requests e pré-carrega os detalhes dos primeiros."""
+        parsed = super().parse_pull_requests(pull_requests)
+        self._prefetch("pull_request", super().get_pull_request, [pr["number"] for pr in parsed])
+        return parsed
+    
+    def get_issue(self, issue_number: int) -> Dict[str, Any]:
+        """Retorna os detalhes da issue, usando o pré-carregamento quando disponível."""
+        prefetched = self._take_prefetched("issue", issue_number)
+        if prefetched is not None:
+            return prefetched
+        return super().get_issue(issue_number)
+    
+    def get_pull_request(self, pr_number: int) -> Dict[str, Any]:
+        """Retorna os detalhes do pull request, usando o pré-carregamento quando disponível."""
+        prefetched = self._take_prefetched("pull_request", pr_number)
+        if prefetched is not None:
+            return prefetched
+        return super().get_pull_request(pr_number)
+
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint, HuggingFacePipeline
 from langchain_core.prompts import PromptTemplate
 
@@ -50,6 +151,105 @@ from src.token_monitor import TokenMonitor
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# torch/transformers só são necessários no pipeline local e a importação a frio
+# custa segundos; os módulos são carregados uma vez, na primeira utilização
+_torch = None
+_transformers = None
+
+
+def _get_torch():
+    """Retorna o módulo torch, importando-o na primeira chamada."""
+    global _torch
+    if _torch is None:
+        import torch
+        _torch = torch
+    return _torch
+
+
+def _get_transformers():
+    """Retorna o módulo transformers, importando-o na primeira chamada."""
+    global _transformers
+    if _transformers is None:
+        import transformers
+        _transformers = transformers
+    return _transformers
+
+
+# Número de prompts agrupados por forward pass no pipeline local
+LOCAL_PIPELINE_BATCH_SIZE = 4
+
+# Marcadores em que a geração deve parar: depois de uma Action o modelo tende a
+# inventar a Observation, e depois do Final Answer a emendar uma nova Question
+REACT_STOP_SEQUENCES = ["\nObservation", "\nQuestion:"]
+
+# Gramática ReAct: pensamento seguido da primeira Action/Action Input ou Final
+# Answer. Após o Action Input, o que o modelo gerar depois (Observation inventada,
+# nova Question...) é descartado; a resposta final é mantida inteira, pois pode
+# conter linhas como "Action:" (ex: passos de GitHub Actions)
+_REACT_RE = re.compile(
+    r"^\s*(?:Thought\s*:\s*)?(?P<thought>.*?)\s*"
+    r"(?:Action\s*:\s*(?P<action>[^\n]+?)\s*Action\s*Input\s*:[ \t]*(?P<action_input>.*?)"
+    r"\s*(?:\n\s*(?:Observation|Question|Thought|Action|Final\s*Answer)\s*:.*)?"
+    r"|Final\s*Answer\s*:[ \t]*(?P<final_answer>.*?)\s*)$",
+    re.DOTALL,
+)
+
+
+# Marcador de parada no fim da saída: o pipeline local (HuggingFacePipeline ignora
+# `stop`) encerra a geração logo após um REACT_STOP_SEQUENCES, sem removê-lo
+_STOP_TRAILER_RE = re.compile(
+    "(?:" + "|".join(re.escape(stop.rstrip(":")) for stop in REACT_STOP_SEQUENCES) + r")\s*:?\s*\Z"
+)
+
+
+class _RepairingReActParser(ReActSingleInputOutputParser):
+    """
+    Parser ReAct que corrige localmente desvios triviais de formato.
+    
+    Com handle_parsing_errors=True, cada saída fora do formato custa uma nova
+    geração completa do LLM. Aqui a saída é validada com uma regex compilada
+    e reescrita no formato canônico (quebras de linha, espaços, texto extra
+    após a primeira ação ou resposta final) antes do parser padrão. Um
+    marcador de parada deixado no fim da saída é removido antes da análise.
+    """
+    
+    def parse(self, text: str):
+        text = _STOP_TRAILER_RE.sub("", text)
+        match = _REACT_RE.match(text)
+        if match:
+            thought = match.group("thought")
+            if match.group("final_answer") is not None:
+                text = f"{thought}\nFinal Answer: {match.group('final_answer')}"
+            else:
+                text = (
+                    f"{thought}\nAction: {match.group('action')}"
+                    f"\nAction Input: {match.group('action_input')}"
+                )
+        return super().parse(text)
+
+
+# Prompt template ReAct, montado uma única vez na importação.
+# Usar format() em vez de f-string para evitar interpretação de variáveis escapadas
+_PROMPT_TEMPLATE = PromptTemplate.from_template("""{system_prompt}
+
+Você tem acesso às seguintes ferramentas:
+
+{{tools}}
+
+Use o seguinte formato:
+
+Question: a pergunta de entrada que você deve responder
+Thought: você deve pensar sobre o que fazer
+Action: a ação a tomar, deve ser uma das [{{tool_names}}]
+Action Input: a entrada para a ação
+Observation: o resultado da ação
+... (este Thought/Action/Action Input/Observation pode repetir N vezes)
+Thought: Agora sei a resposta final
+Final Answer: a resposta final à pergunta original
+
+Question: {{input}}
+Thought:{{agent_scratchpad}}""".format(system_prompt=get_system_prompt_with_examples()))
+
 
 def setup_github_toolkit(github_token: Optional[str] = None, github_repository: Optional[str] = None) -> GitHubToolkit:
     """
@@ -79,7 +279,8 @@ def setup_github_toolkit(github_token: Optional[str] = None, github_repository:
         repo_name = os.getenv("REPO_NAME", "langchain")
         github_repository = f"{repo_owner}/{repo_name}"
     
-    # Usar wrapper customizado que suporta tokens pessoais
+    # Usar wrapper customizado que suporta tokens pessoais; o cliente e o repositório
+    # vêm de _get_repo, então recriar o toolkit não repete a chamada get_repo à API
     github = PersonalTokenGitHubAPIWrapper(
         github_token=github_token,
         github_repository=github_repository
@@ -97,6 +298,89 @@ def setup_github_toolkit(github_token: Optional[str] = None, github_repository:
     return toolkit
 
 
+class _StopOnSubstrings:
+    """
+    Critério de parada do pipeline local: encerra a geração assim que um dos
+    marcadores ReAct aparece no texto gerado, em vez de gerar até max_new_tokens
+    e deixar o executor descartar o excesso.
+    """
+    
+    # Tokens decodificados do final da sequência a cada passo
+    WINDOW = 16
+    
+    def __init__(self, tokenizer, stop_sequences: List[str]):
+        self.tokenizer = tokenizer
+        self.stop_sequences = stop_sequences
+        self._torch = _get_torch()
+    
+    def _hit(self, ids) -> bool:
+        # Compara a janela com e sem o último token: só conta marcador completado
+        # pelo token novo, nunca um que já estava no prompt
+        window = ids[-self.WINDOW:]
+        current = self.tokenizer.decode(window, skip_special_tokens=True)
+        previous = self.tokenizer.decode(window[:-1], skip_special_tokens=True)
+        return any(current.count(stop) > previous.count(stop) for stop in self.stop_sequences)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return self._torch.tensor(
+            [self._hit(row.tolist()) for row in input_ids],
+            dtype=self._torch.bool,
+            device=input_ids.device,
+        )
+
+
+def _create_local_pipeline(model_name: str, temperature: float, max_tokens: int):
+    """
+    Cria o pipeline local de geração de texto do transformers.
+    
+    Em GPU com bitsandbytes disponível, os pesos são carregados quantizados em
+    4 bits (NF4): a decodificação é limitada pela leitura dos pesos, então
+    reduzir ~14 GB (fp16) para ~4 GB em um modelo 7B aumenta tokens/s.
+    
+    Args:
+        model_name: Nome do modelo HuggingFace
+        temperature: Temperatura para geração
+        max_tokens: Número máximo de tokens na resposta
+        
+    Returns:
+        Pipeline "text-generation" configurado para inferência em lote
+    """
+    torch = _get_torch()
+    transformers = _get_transformers()
+    
+    tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+    if tokenizer.pad_token is None:
+        # Necessário para agrupar prompts em lote
+        tokenizer.pad_token = tokenizer.eos_token
+    
+    if torch.cuda.is_available() and importlib.util.find_spec("bitsandbytes") is not None:
+        model = transformers.AutoModelForCausalLM.from_pretrained(
+            model_name,
+            quantization_config=transformers.BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4",
+            ),
+            device_map="auto",
+        )
+    else:
+        model = transformers.AutoModelForCausalLM.from_pretrained(
+            model_name,
+            device_map="auto",
+            torch_dtype=torch.float16 if torch.cuda.is_available() else "auto",
+        )
+    
+    return transformers.pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        stopping_criteria=transformers.StoppingCriteriaList([_StopOnSubstrings(tokenizer, REACT_STOP_SEQUENCES)]),
+        temperature=temperature,
+        max_new_tokens=max_tokens,
+        batch_size=LOCAL_PIPELINE_BATCH_SIZE,
+    )
+
+
 def create_agent(
     model_name: Optional[str] = None,
     temperature: float = 0.7,
@@ -112,7 +396,8 @@ def create_agent(
         temperature: Temperatura para geração (default: 0.7)
         max_tokens: Número máximo de tokens na resposta (default: 1000)
         github_token: Token do GitHub (se None, usa GITHUB_TOKEN do .env)
-        token_monitor: Instância do TokenMonitor (se None, cria nova)
+        token_monitor: Instância do TokenMonitor (se None, cria uma que pertence ao executor
+            e é liberada junto com ele; passe uma própria para consultar relatórios ou fechá-la)
         
     Returns:
         AgentExecutor configurado
@@ -134,7 +419,18 @@ def create_agent(
     try:
         # Tentar usar HuggingFaceEndpoint primeiro (para modelos na nuvem)
         hf_token = os.getenv("HUGGINGFACE_API_TOKEN")
-        if hf_token:
+        endpoint_url = os.getenv("LLM_ENDPOINT_URL")
+        if endpoint_url:
+            # Servidor local de inferência (text-generation-inference / vLLM) com
+            # prefix caching: o prefixo ReAct é idêntico em todos os turnos
+            hf_endpoint = HuggingFaceEndpoint(
+                endpoint_url=endpoint_url,
+                huggingfacehub_api_token=hf_token,
+                temperature=temperature,
+                max_new_tokens=max_tokens,
+            )
+            llm = ChatHuggingFace(llm=hf_endpoint)
+        elif hf_token:
             # Criar HuggingFaceEndpoint e depois ChatHuggingFace
             hf_endpoint = HuggingFaceEndpoint(
                 repo_id=model_name,
@@ -145,16 +441,8 @@ def create_agent(
             llm = ChatHuggingFace(llm=hf_endpoint)
         else:
             # Usar modelo local via HuggingFacePipeline e ChatHuggingFace
-            from transformers import pipeline
-            
-            # Criar pipeline local
-            pipe = pipeline(
-                "text-generation",
-                model=model_name,
-                temperature=temperature,
-                max_new_tokens=max_tokens,
-            )
-            hf_pipeline = HuggingFacePipeline(pipeline=pipe)
+            pipe = _create_local_pipeline(model_name, temperature, max_tokens)
+            hf_pipeline = HuggingFacePipeline(pipeline=pipe, batch_size=LOCAL_PIPELINE_BATCH_SIZE)
             llm = ChatHuggingFace(llm=hf_pipeline)
     except Exception as e:
         print(f"⚠ Erro ao carregar modelo {model_name}: {e}")
@@ -173,34 +461,14 @@ def create_agent(
                 f"Erro original: {e}. Erro no fallback: {e2}"
             )
     
-    # Criar prompt template (ReAct format)
-    system_prompt = get_system_prompt_with_examples()
-    
-    # Usar format() em vez de f-string para evitar interpretação de variáveis escapadas
-    prompt_template = """{system_prompt}
-
-Você tem acesso às seguintes ferramentas:
-
-{{tools}}
-
-Use o seguinte formato:
-
-Question: a pergunta de entrada que você deve responder
-Thought: você deve pensar sobre o que fazer
-Action: a ação a tomar, deve ser uma das [{{tool_names}}]
-Action Input: a entrada para a ação
-Observation: o resultado da ação
-... (este Thought/Action/Action Input/Observation pode repetir N vezes)
-Thought: Agora sei a resposta final
-Final Answer: a resposta final à pergunta original
-
-Question: {{input}}
-Thought:{{agent_scratchpad}}""".format(system_prompt=system_prompt)
-    
-    prompt = PromptTemplate.from_template(prompt_template)
-    
     # Criar agente ReAct (compatível com HuggingFace)
-    agent = create_react_agent(llm, tools, prompt)
+    agent = create_react_agent(
+        llm,
+        tools,
+        _PROMPT_TEMPLATE,
+        output_parser=_RepairingReActParser(),
+        stop_sequence=REACT_STOP_SEQUENCES,
+    )
     
     # Criar executor
     agent_executor = AgentExecutor(
@@ -214,27 +482,34 @@ Thought:{{agent_scratchpad}}""".format(system_prompt=system_prompt)
     return agent_executor
 
 
-def test_github_connection(repo_owner: str, repo_name: str) -> bool:
+def test_github_connection(repo_owner: str, repo_name: str, github_token: Optional[str] = None) -> bool:
     """
-    Testa a conexão com o GitHub listando issues abertas.
+    Testa a conexão com o GitHub com uma única requisição HEAD ao repositório.
     
     Args:
         repo_owner: Proprietário do repositório
         repo_name: Nome do repositório
+        github_token: Token do GitHub (se None, usa GITHUB_TOKEN do .env)
         
     Returns:
         True se a conexão funcionar, False caso contrário
     """
+    if github_token is None:
+        github_token = os.getenv("GITHUB_TOKEN")
+    
     try:
-        github_repository = f"{repo_owner}/{repo_name}"
-        toolkit = setup_github_toolkit(github_repository=github_repository)
-        # Usar uma tool simples para testar
-        tools = toolkit.get_tools()
-        if tools:
-            print(f"✓ Conexão com GitHub estabelecida. {len(tools)} ferramentas disponíveis.")
-            return True
-    except Exception as e:
+        response = requests.head(
+            f"https://api.github.com/repos/{repo_owner}/{repo_name}",
+            headers={"Authorization": f"Bearer {github_token}"},
+            timeout=5,
+        )
+    except requests.RequestException as e:
         print(f"✗ Erro ao conectar com GitHub: {e}")
         return False
+    
+    if response.status_code == 200:
+        print(f"✓ Conexão com GitHub estabelecida ({repo_owner}/{repo_name}).")
+        return True
+    
+    print(f"✗ Erro ao conectar com GitHub: HTTP {response.status_code}")
     return False
-
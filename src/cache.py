@@ -1,27 +1,134 @@
-"""Cache em memória para consultas ao GitHub."""
+"""Cache em memória (com persistência opcional em SQLite) para consultas ao GitHub."""
 
 import hashlib
+import re
+import sqlite3
+import threading
 import time
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+import orjson
+
+try:
+    from xxhash import xxh3_128_hexdigest
+except ImportError:  # xxhash é opcional; blake2b (stdlib) é o fallback
+    xxh3_128_hexdigest = None
+
+
+def _hash_key(key_string: str) -> str:
+    """Hash hexadecimal de 128 bits para chaves curtas do cache."""
+    # xxhash 4.x só aceita bytes
+    if xxh3_128_hexdigest is not None:
+        return xxh3_128_hexdigest(key_string.encode())
+    return hashlib.blake2b(key_string.encode(), digest_size=16).hexdigest()
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Trechos que identificam o objeto da pergunta: texto entre aspas, caminhos/arquivos,
+# referências (#123) e números. Perguntas que diferem neles têm embeddings quase iguais
+_IDENTIFIER_RE = re.compile(r"\"[^\"]*\"|'[^']*'|`[^`]*`|[\w.-]*/[\w./-]*|[\w-]+(?:\.[\w-]+)+|#?\d+")
+# Estados que invertem o sentido da pergunta ("issues abertas" vs "issues fechadas")
+_STATE_TERMS = frozenset({
+    "aberta", "abertas", "aberto", "abertos", "fechada", "fechadas", "fechado", "fechados",
+    "mergeada", "mergeadas", "mergeado", "mergeados", "open", "closed", "merged",
+})
+
+
+def _normalize_query(query: str) -> str:
+    """
+    Normaliza a pergunta para aumentar a taxa de acerto do cache.
+    
+    Aplica NFKC, casefold (mais adequado que lower() para acentos) e colapsa
+    espaços, de modo que " Quais issues  abertas? " e "quais issues abertas?"
+    compartilhem a mesma entrada.
+    """
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query).strip().casefold())
+
+
+def _query_identifiers(query: str) -> Tuple[str, ...]:
+    """
+    Extrai da pergunta normalizada os termos que precisam coincidir exatamente.
+    
+    Args:
+        query: Pergunta do usuário
+        
+    Returns:
+        Identificadores e termos de estado, ordenados
+    """
+    normalized = _normalize_query(query)
+    identifiers = {match.rstrip(".") for match in _IDENTIFIER_RE.findall(normalized)}
+    identifiers.update(word for word in re.findall(r"\w+", normalized) if word in _STATE_TERMS)
+    return tuple(sorted(identifiers))
 
 
 class QueryCache:
-    """Cache em memória com TTL para reduzir chamadas à API do GitHub."""
+    """
+    Cache LRU em memória com TTL para reduzir chamadas à API do GitHub.
+    
+    As entradas são distribuídas em shards, cada um com seu próprio lock, para
+    que callbacks ou ferramentas executando em threads diferentes não
+    corrompam o armazenamento nem serializem todas as consultas.
     
-    def __init__(self, ttl_seconds: int = 3600):
+    Com db_path, as entradas também são gravadas em SQLite (modo WAL), de modo
+    que execuções seguintes reaproveitam respostas sem novas chamadas ao LLM.
+    """
+    
+    def __init__(self, ttl_seconds: int = 3600, maxsize: int = 1024, num_shards: int = 16,
+                 db_path: Optional[str] = None):
         """
         Inicializa o cache.
         
         Args:
             ttl_seconds: Tempo de vida do cache em segundos (default: 1 hora)
+            maxsize: Número máximo de entradas em memória, somando todos os shards
+            num_shards: Número de shards (potência de 2)
+            db_path: Caminho do banco SQLite para persistência (se None, apenas memória)
         """
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        if num_shards < 1 or num_shards & (num_shards - 1):
+            raise ValueError("num_shards deve ser uma potência de 2")
+        
         self.ttl = ttl_seconds
+        self.maxsize = maxsize
+        self._shard_mask = num_shards - 1
+        # Por shard: chave -> (valor, expiração em time.monotonic()), da menos para a mais recente
+        self._shards: List["OrderedDict[str, Tuple[Any, float]]"] = [
+            OrderedDict() for _ in range(num_shards)
+        ]
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        # Total de entradas em todos os shards, para aplicar maxsize de forma global
+        self._size = 0
+        self._size_lock = threading.Lock()
+        
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._init_database()
+    
+    def _init_database(self):
+        """Abre o banco SQLite em modo WAL, cria a tabela do cache e descarta linhas expiradas."""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA mmap_size=268435456;
+            CREATE TABLE IF NOT EXISTS query_cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expiry REAL NOT NULL
+            ) WITHOUT ROWID;
+        """)
+        # Sem esta limpeza, linhas expiradas de execuções anteriores se acumulariam
+        self._conn.execute("DELETE FROM query_cache WHERE expiry <= ?", (time.time(),))
     
     def _generate_key(self, query: str, repo_owner: str, repo_name: str) -> str:
         """
-        Gera chave única para a query.
+        Gera chave única para a query normalizada.
         
         Args:
             query: Pergunta do usuário
@@ -29,10 +136,13 @@ class QueryCache:
             repo_name: Nome do repositório
             
         Returns:
-            Hash MD5 da chave
+            Hash xxh3-128 da chave (blake2b se xxhash não estiver instalado)
         """
-        key_string = f"{query}|{repo_owner}|{repo_name}"
-        return hashlib.md5(key_string.encode()).hexdigest()
+        return _hash_key(f"{_normalize_query(query)}|{repo_owner}|{repo_name}")
+    
+    def _shard_index(self, key: str) -> int:
+        """Seleciona o shard a partir dos primeiros 32 bits do hash hexadecimal."""
+        return int(key[:8], 16) & self._shard_mask
     
     def get(self, query: str, repo_owner: str, repo_name: str) -> Optional[Any]:
         """
@@ -47,19 +157,76 @@ class QueryCache:
             Valor em cache ou None se não encontrado/expirado
         """
         key = self._generate_key(query, repo_owner, repo_name)
+        index = self._shard_index(key)
+        shard = self._shards[index]
+        
+        with self._locks[index]:
+            entry = shard.get(key)
+            if entry is not None:
+                value, expiry = entry
+                
+                # Verificar se expirou
+                if expiry >= time.monotonic():
+                    shard.move_to_end(key)
+                    return value
+                del shard[key]
+                self._add_size(-1)
         
-        if key not in self.cache:
+        if self._conn is None:
             return None
         
-        entry = self.cache[key]
-        timestamp = entry["timestamp"]
+        # Expiração no banco usa o relógio de parede para valer entre processos
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value, expiry FROM query_cache WHERE key = ? AND expiry > ?", (key, now)
+            ).fetchone()
+        if row is None:
+            return None
         
-        # Verificar se expirou
-        if datetime.now() - timestamp > timedelta(seconds=self.ttl):
-            del self.cache[key]
+        try:
+            value = orjson.loads(row[0])
+        except orjson.JSONDecodeError:
+            # Entrada gravada em outro formato (ex: pickle de versões anteriores)
             return None
+        self._store(index, key, value, time.monotonic() + (row[1] - now))
+        return value
+    
+    def _add_size(self, delta: int):
+        """Atualiza o total de entradas em memória."""
+        with self._size_lock:
+            self._size += delta
+    
+    def _store(self, index: int, key: str, value: Any, expiry: float):
+        """Insere a entrada no shard em memória, descartando as menos usadas."""
+        shard = self._shards[index]
+        with self._locks[index]:
+            is_new = key not in shard
+            shard[key] = (value, expiry)
+            shard.move_to_end(key)
+        if is_new:
+            self._add_size(1)
+            self._evict_overflow(index)
+    
+    def _evict_overflow(self, start: int):
+        """
+        Descarta entradas menos usadas até o total voltar a caber em maxsize.
         
-        return entry["value"]
+        A remoção começa pelo shard que recebeu a inserção (sem tocar na entrada
+        recém-inserida) e segue para os próximos; um lock de shard por vez, para
+        não haver deadlock entre inserções concorrentes.
+        """
+        num_shards = len(self._shards)
+        for offset in range(num_shards):
+            if self._size <= self.maxsize:
+                return
+            index = (start + offset) & self._shard_mask
+            shard = self._shards[index]
+            keep = 1 if offset == 0 else 0
+            with self._locks[index]:
+                while len(shard) > keep and self._size > self.maxsize:
+                    shard.popitem(last=False)
+                    self._add_size(-1)
     
     def set(self, query: str, repo_owner: str, repo_name: str, value: Any):
         """
@@ -72,25 +239,53 @@ class QueryCache:
             value: Valor a armazenar
         """
         key = self._generate_key(query, repo_owner, repo_name)
+        self._store(self._shard_index(key), key, value, time.monotonic() + self.ttl)
         
-        self.cache[key] = {
-            "value": value,
-            "timestamp": datetime.now()
-        }
+        if self._conn is None:
+            return
+        
+        try:
+            blob = orjson.dumps(value)
+        except TypeError:
+            # Valores não serializáveis em JSON ficam apenas em memória
+            return
+        
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, value, expiry) VALUES (?, ?, ?)",
+                (key, blob, time.time() + self.ttl)
+            )
     
     def clear(self):
         """Limpa todo o cache."""
-        self.cache.clear()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                self._add_size(-len(shard))
+                shard.clear()
+        
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM query_cache")
     
     def clear_expired(self):
-        """Remove apenas entradas expiradas."""
-        now = datetime.now()
-        expired_keys = [
-            key for key, entry in self.cache.items()
-            if now - entry["timestamp"] > timedelta(seconds=self.ttl)
-        ]
-        for key in expired_keys:
-            del self.cache[key]
+        """
+        Remove entradas expiradas da memória e do banco.
+        
+        A ordem LRU não acompanha a expiração (um get move a entrada para o fim
+        e entradas recarregadas do banco mantêm o TTL restante), então cada
+        shard é varrido por completo.
+        """
+        now = time.monotonic()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                expired = [key for key, (_, expiry) in shard.items() if expiry < now]
+                for key in expired:
+                    del shard[key]
+                self._add_size(-len(expired))
+        
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM query_cache WHERE expiry <= ?", (time.time(),))
     
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -101,7 +296,305 @@ class QueryCache:
         """
         self.clear_expired()
         return {
-            "total_entries": len(self.cache),
-            "ttl_seconds": self.ttl
+            "total_entries": sum(len(shard) for shard in self._shards),
+            "max_entries": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "db_path": self.db_path
         }
+    
+    def close(self):
+        """Fecha a conexão com o banco de persistência, se houver."""
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+                self._conn = None
+
+
+class SemanticQueryCache:
+    """
+    Cache semântico sobre o QueryCache.
+    
+    Perguntas parafraseadas ("o que faz X" vs "explique X") não geram o mesmo
+    hash, então cada uma dispararia uma nova rodada de LLM + API do GitHub.
+    Esta camada guarda o embedding normalizado de cada pergunta e, quando a
+    busca exata falha, retorna a entrada mais similar (cosseno) acima do
+    limiar configurado, isolada por repositório.
+    
+    Embeddings não distinguem "issue #123" de "issue #124": números,
+    referências, caminhos, trechos entre aspas e estados (abertas/fechadas)
+    fazem parte da chave do índice, então só perguntas com os mesmos
+    identificadores podem compartilhar uma resposta.
+    """
+    
+    DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+    
+    def __init__(self, cache: Optional[QueryCache] = None, ttl_seconds: int = 3600,
+                 similarity_threshold: float = 0.92, model_name: str = DEFAULT_MODEL,
+                 embed_fn: Optional[Callable[[str], Any]] = None):
+        """
+        Inicializa o cache semântico.
+        
+        Args:
+            cache: QueryCache usado para a busca exata (se None, cria um novo)
+            ttl_seconds: Tempo de vida das entradas semânticas em segundos
+            similarity_threshold: Similaridade mínima (cosseno) para considerar um acerto
+            model_name: Modelo sentence-transformers usado para gerar embeddings
+            embed_fn: Função alternativa texto -> vetor (ex: endpoint local do nomic-embed-text)
+        """
+        self.exact = cache if cache is not None else QueryCache(ttl_seconds=ttl_seconds)
+        self.ttl = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.model_name = model_name
+        self._embed_fn = embed_fn
+        self._embedder_failed = False
+        # Um índice por (repo_owner, repo_name, identificadores) para evitar respostas
+        # de outro repositório ou sobre outro objeto, do menos para o mais usado. O total
+        # de entradas somando todos os índices é limitado por cache.maxsize
+        self._namespaces: "OrderedDict[Tuple[str, str, Tuple[str, ...]], _SemanticNamespace]" = OrderedDict()
+        self._semantic_entries = 0
+        self._lock = threading.Lock()
+    
+    def _embed(self, query: str) -> Optional[Any]:
+        """
+        Gera o embedding normalizado (float32) da query.
+        
+        Args:
+            query: Pergunta do usuário
+            
+        Returns:
+            Vetor normalizado ou None se nenhum modelo de embeddings estiver disponível
+        """
+        if self._embed_fn is None:
+            if self._embedder_failed:
+                return None
+            try:
+                from sentence_transformers import SentenceTransformer
+                
+                model = SentenceTransformer(self.model_name)
+                self._embed_fn = lambda text: model.encode(text, normalize_embeddings=True)
+            except Exception as e:
+                print(f"Warning: Cache semântico desativado ({self.model_name}): {e}")
+                self._embedder_failed = True
+                return None
+        
+        import numpy as np
+        
+        vector = np.asarray(self._embed_fn(_normalize_query(query)), dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+    
+    def get(self, query: str, repo_owner: str, repo_name: str) -> Optional[Any]:
+        """
+        Recupera valor do cache por igualdade exata ou similaridade semântica.
+        
+        Args:
+            query: Pergunta do usuário
+            repo_owner: Proprietário do repositório
+            repo_name: Nome do repositório
+            
+        Returns:
+            Valor em cache ou None se não encontrado/expirado
+        """
+        # A busca exata é mais barata que gerar um embedding, então vem primeiro
+        value = self.exact.get(query, repo_owner, repo_name)
+        if value is not None:
+            return value
+        
+        namespace_key = (repo_owner, repo_name, _query_identifiers(query))
+        if namespace_key not in self._namespaces:
+            return None
+        
+        vector = self._embed(query)
+        if vector is None:
+            return None
+        with self._lock:
+            namespace = self._namespaces.get(namespace_key)
+            if namespace is None:
+                return None
+            self._namespaces.move_to_end(namespace_key)
+            return namespace.search(vector, self.similarity_threshold, time.monotonic() - self.ttl)
+    
+    def set(self, query: str, repo_owner: str, repo_name: str, value: Any):
+        """
+        Armazena valor no cache exato e no índice semântico.
+        
+        Args:
+            query: Pergunta do usuário
+            repo_owner: Proprietário do repositório
+            repo_name: Nome do repositório
+            value: Valor a armazenar
+        """
+        self.exact.set(query, repo_owner, repo_name, value)
+        
+        vector = self._embed(query)
+        if vector is None:
+            return
+        
+        namespace_key = (repo_owner, repo_name, _query_identifiers(query))
+        now = time.monotonic()
+        with self._lock:
+            namespace = self._namespaces.get(namespace_key)
+            if namespace is None:
+                namespace = self._namespaces[namespace_key] = _SemanticNamespace(vector.shape[0])
+            self._namespaces.move_to_end(namespace_key)
+            namespace.add(vector, value, now)
+            self._semantic_entries += 1
+            
+            # Acima do limite: descartar os índices menos usados e, se só restar este,
+            # suas entradas mais antigas
+            while self._semantic_entries > self.exact.maxsize:
+                oldest_key = next(iter(self._namespaces))
+                if oldest_key == namespace_key:
+                    self._compact_namespace(namespace_key, now - self.ttl, self.exact.maxsize)
+                    break
+                self._semantic_entries -= self._namespaces.pop(oldest_key).size
+    
+    def _compact_namespace(self, namespace_key: Tuple[str, str, Tuple[str, ...]],
+                           min_timestamp: float, max_entries: Optional[int] = None):
+        """Compacta um índice (com o lock adquirido), removendo-o se ficar vazio."""
+        namespace = self._namespaces[namespace_key]
+        size = namespace.size
+        namespace.compact(min_timestamp, max_entries=max_entries)
+        self._semantic_entries -= size - namespace.size
+        if namespace.size == 0:
+            del self._namespaces[namespace_key]
+    
+    def clear(self):
+        """Limpa todo o cache."""
+        self.exact.clear()
+        with self._lock:
+            self._namespaces.clear()
+            self._semantic_entries = 0
+    
+    def clear_expired(self):
+        """Remove apenas entradas expiradas."""
+        self.exact.clear_expired()
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            for namespace_key in list(self._namespaces):
+                self._compact_namespace(namespace_key, cutoff)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna estatísticas do cache.
+        
+        Returns:
+            Dicionário com estatísticas
+        """
+        stats = self.exact.get_stats()
+        self.clear_expired()
+        stats["semantic_entries"] = self._semantic_entries
+        stats["semantic_namespaces"] = len(self._namespaces)
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+
+_faiss: Any = None
+
+
+def _get_faiss() -> Optional[Any]:
+    """Retorna o módulo faiss se instalado (importado uma única vez), ou None."""
+    global _faiss
+    if _faiss is None:
+        try:
+            import faiss
+            _faiss = faiss
+        except ImportError:
+            _faiss = False
+    return _faiss or None
+
 
+class _SemanticNamespace:
+    """
+    Embeddings de um repositório em uma matriz contígua (N, dim) + entradas paralelas.
+    
+    Com faiss instalado, a busca usa um índice exato de produto interno
+    (IndexFlatIP, uma gemv vetorizada). Sem faiss, a busca é um produto
+    matriz-vetor em numpy.
+    """
+    
+    # Vizinhos consultados primeiro no índice; se todos estiverem expirados, a busca é refeita
+    # sobre todas as entradas para não esconder uma entrada válida menos similar
+    SEARCH_K = 4
+    
+    def __init__(self, dim: int, initial_capacity: int = 4):
+        import numpy as np
+        
+        self.embs = np.empty((initial_capacity, dim), dtype=np.float32)
+        self.entries: List[Tuple[Any, float]] = []  # (valor, timestamp)
+        self.index: Any = None
+        self._rebuild_index()
+    
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+    
+    def _rebuild_index(self):
+        """Recria o índice faiss a partir da matriz de embeddings."""
+        faiss = _get_faiss()
+        if faiss is None:
+            return
+        
+        index = faiss.IndexFlatIP(self.embs.shape[1])
+        if self.size:
+            index.add(self.embs[:self.size])
+        self.index = index
+    
+    def add(self, vector: Any, value: Any, timestamp: float):
+        """Adiciona um embedding, dobrando a capacidade da matriz quando necessário."""
+        import numpy as np
+        
+        if self.size == self.embs.shape[0]:
+            grown = np.empty((max(4, self.embs.shape[0] * 2), self.embs.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.embs[:self.size]
+            self.embs = grown
+        self.embs[self.size] = vector
+        self.entries.append((value, timestamp))
+        
+        if self.index is not None:
+            self.index.add(self.embs[self.size - 1:self.size])
+    
+    def search(self, vector: Any, threshold: float, min_timestamp: float) -> Optional[Any]:
+        """Retorna o valor válido mais similar ao vetor, se acima do limiar."""
+        import numpy as np
+        
+        # Vetores normalizados: produto interno == similaridade de cosseno
+        if self.index is None:
+            scores = self.embs[:self.size] @ vector
+            candidates = np.flatnonzero(scores >= threshold)
+            return self._first_valid(candidates[np.argsort(-scores[candidates])], min_timestamp)
+        
+        k = min(self.SEARCH_K, self.size)
+        while True:
+            scores, ids = self.index.search(vector.reshape(1, -1), k)
+            ranked = [idx for score, idx in zip(scores[0], ids[0]) if idx >= 0 and score >= threshold]
+            value = self._first_valid(ranked, min_timestamp)
+            # Os k vizinhos acima do limiar estavam todos expirados: buscar em todas as entradas
+            if value is not None or len(ranked) < k or k == self.size:
+                return value
+            k = self.size
+    
+    def _first_valid(self, ranked: Any, min_timestamp: float) -> Optional[Any]:
+        """Retorna o valor da primeira entrada não expirada, na ordem de similaridade."""
+        for idx in ranked:
+            value, timestamp = self.entries[idx]
+            if timestamp >= min_timestamp:
+                return value
+        return None
+    
+    def compact(self, min_timestamp: float, max_entries: Optional[int] = None):
+        """Remove entradas expiradas (e as mais antigas além de max_entries) mantendo a matriz contígua."""
+        keep = [i for i, (_, timestamp) in enumerate(self.entries) if timestamp >= min_timestamp]
+        if max_entries is not None:
+            keep = keep[-max_entries:]
+        if len(keep) == self.size:
+            return
+        if 4 * len(keep) < self.embs.shape[0]:
+            # Liberar a capacidade ociosa de índices que encolheram
+            self.embs = self.embs[keep]
+        else:
+            self.embs[:len(keep)] = self.embs[keep]
+        self.entries = [self.entries[i] for i in keep]
+        self._rebuild_index()
@@ -1,5 +1,7 @@
 """Prompts e exemplos few-shot para o agente GitHub."""
 
+from typing import Tuple
+
 SYSTEM_PROMPT = """Você é um assistente especializado em analisar repositórios GitHub. 
 Sua função é responder perguntas sobre issues, commits, pull requests e conteúdo de arquivos.
 
@@ -77,6 +79,23 @@ Fonte: Commit abc123 - [URL_COMMIT]"""
     }
 ]
 
+# Bloco few-shot pré-renderizado na importação (apenas os 3 primeiros exemplos)
+_EXAMPLES_HEADER = "\n\nEXEMPLOS DE PERGUNTAS E RESPOSTAS:\n\n"
+_EXAMPLE_BLOCKS = tuple(
+    f"Exemplo {i}:\nPergunta: {example['input']}\nResposta: {example['output']}\n\n"
+    for i, example in enumerate(FEW_SHOT_EXAMPLES[:3], 1)
+)
+_EXAMPLES_TEXT = _EXAMPLES_HEADER + "".join(_EXAMPLE_BLOCKS)
+
+_FULL_PROMPT = SYSTEM_PROMPT + _EXAMPLES_TEXT
+
+# Fronteiras estáveis do prompt: o system prompt e o prompt ao fim de cada exemplo
+_PROMPT_PREFIXES = (SYSTEM_PROMPT,) + tuple(
+    SYSTEM_PROMPT + _EXAMPLES_HEADER + "".join(_EXAMPLE_BLOCKS[:i])
+    for i in range(1, len(_EXAMPLE_BLOCKS) + 1)
+)
+
+
 def get_system_prompt_with_examples() -> str:
     """
     Retorna o system prompt combinado com exemplos few-shot.
@@ -84,11 +103,14 @@ def get_system_prompt_with_examples() -> str:
     Returns:
         String com prompt completo
     """
-    examples_text = "\n\nEXEMPLOS DE PERGUNTAS E RESPOSTAS:\n\n"
-    for i, example in enumerate(FEW_SHOT_EXAMPLES[:3], 1):  # Mostrar apenas 3 exemplos
-        examples_text += f"Exemplo {i}:\n"
-        examples_text += f"Pergunta: {example['input']}\n"
-        examples_text += f"Resposta: {example['output']}\n\n"
-    
-    return SYSTEM_PROMPT + examples_text
+    return _FULL_PROMPT
 
+
+def get_prompt_prefixes() -> Tuple[str, ...]:
+    """
+    Retorna os prefixos invariantes do prompt, do mais curto ao prompt completo.
+    
+    Returns:
+        Tupla com o system prompt e o prompt acumulado ao fim de cada exemplo few-shot
+    """
+    return _PROMPT_PREFIXES
@@ -1,25 +1,99 @@
 """Monitor de tokens para rastrear consumo em interações com LLM."""
 
+import atexit
+import functools
+import hashlib
 import sqlite3
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from pathlib import Path
 from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.outputs import LLMResult
-from transformers import AutoTokenizer
+
+from src.prompts import get_prompt_prefixes
+
+
+# Carrega o tokenizer em segundo plano enquanto o agente é inicializado
+_TOKENIZER_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenizer-load")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_tokenizer(model_name: str) -> Any:
+    """
+    Carrega (uma vez por processo) o tokenizer Rust do modelo.
+    
+    Usa a biblioteca tokenizers diretamente; transformers só é importado
+    quando o modelo não publica um tokenizer.json.
+    
+    Args:
+        model_name: Nome do modelo HuggingFace
+        
+    Returns:
+        Tokenizer (tokenizers.Tokenizer) do modelo
+    """
+    from tokenizers import Tokenizer
+    
+    try:
+        tokenizer = Tokenizer.from_pretrained(model_name)
+    except Exception:
+        # Importado apenas aqui: transformers custa segundos e centenas de MB na importação
+        from transformers import AutoTokenizer
+        
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True).backend_tokenizer
+    
+    # A contagem deve refletir o texto inteiro, sem truncamento ou padding
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+# Bancos cujo esquema já foi criado/migrado neste processo
+_schema_initialized: Set[str] = set()
+
+
+def _text_key(text: str) -> Tuple[int, int]:
+    """Chave compacta para o cache de contagens (colisões são desprezíveis)."""
+    return hash(text), len(text)
+
+
+def _flush_if_alive(monitor_ref: "weakref.ref[TokenMonitor]"):
+    """Grava os registros pendentes do monitor no atexit, se ele ainda existir."""
+    monitor = monitor_ref()
+    if monitor is not None:
+        monitor.flush()
 
 
 class TokenMonitor(BaseCallbackHandler):
     """Monitor que rastreia tokens consumidos e persiste em SQLite."""
     
-    def __init__(self, db_path: str = "data/token_usage.db", model_name: str = ""):
+    # Número máximo de prefixos com contagem de tokens em cache
+    MAX_PREFIXES = 32
+    # Número máximo de textos com contagem de tokens em cache
+    TOKEN_CACHE_SIZE = 4096
+    # Registros acumulados antes de gravar no banco em uma única transação
+    FLUSH_THRESHOLD = 32
+    # Segundos máximos que um registro fica pendente: um timer em segundo plano grava
+    # o lote, já que em sessões interativas o limite acima raramente é atingido
+    FLUSH_INTERVAL = 5.0
+    # Filtro de período de get_report; limites None não restringem
+    _REPORT_WHERE = "WHERE ts >= COALESCE(?, 0) AND ts <= COALESCE(?, 9223372036854775807)"
+    
+    def __init__(self, db_path: str = "data/token_usage.db", model_name: str = "",
+                 count_fn: Optional[Callable[[str], int]] = None):
         """
         Inicializa o monitor de tokens.
         
         Args:
             db_path: Caminho para o banco de dados SQLite
             model_name: Nome do modelo LLM sendo usado
+            count_fn: Contador de tokens alternativo (ex: em testes); quando
+                definido, dispensa o tokenizer
         """
         self.db_path = db_path
         self.model_name = model_name
@@ -31,21 +105,64 @@ class TokenMonitor(BaseCallbackHandler):
         }
         self.current_query: Optional[str] = None
         self.tokenizer: Optional[Any] = None
+        self._tokenizer_future: Optional[Future] = None
+        self.count_fn = count_fn
+        # Protege os caches de contagem, usados por callbacks de várias threads
+        self._cache_lock = threading.Lock()
+        # O mesmo prefixo (system prompt + exemplos) é enviado a cada turno;
+        # contagens de textos idênticos são reaproveitadas. A chave é (hash, tamanho):
+        # o hash de str fica memorizado no objeto e o texto não é retido no cache
+        self._token_counts: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._token_cache_hits = 0
+        self._token_cache_misses = 0
+        # Prefixo -> contagem de tokens (None até ser calculada com o tokenizer atual)
+        self._prefix_counts: "OrderedDict[str, Optional[int]]" = OrderedDict()
+        for prefix in get_prompt_prefixes():
+            self.register_prefix(prefix)
+            # Modelos de chat chegam ao callback formatados por get_buffer_string
+            self.register_prefix(f"Human: {prefix}")
+        
+        # Registros de log_query ainda não gravados no banco
+        self._pending: List[tuple] = []
+        # Timer que grava os registros pendentes após FLUSH_INTERVAL (None se não agendado)
+        self._flush_timer: Optional[threading.Timer] = None
         
         # Criar diretório se não existir
-        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        parent = Path(db_path).parent
+        if not parent.exists():
+            parent.mkdir(parents=True, exist_ok=True)
+        db_existed = os.path.exists(db_path)
         
-        # Inicializar banco de dados
-        self._init_database()
+        # Conexão persistente em autocommit; as gravações em lote abrem a própria transação.
+        # WAL + synchronous=NORMAL evita um fsync por registro no caminho do LLM
+        # Os callbacks do LangChain podem disparar de várias threads: o lock serializa o uso
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, cached_statements=256
+        )
+        self._lock = threading.Lock()
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY;"
+        )
+        
+        # Inicializar banco de dados (o esquema é verificado uma vez por arquivo no processo)
+        schema_key = os.path.abspath(db_path)
+        if not (db_existed and schema_key in _schema_initialized):
+            self._init_database()
+            if db_path != ":memory:":
+                _schema_initialized.add(schema_key)
+        
+        # Gravar registros pendentes ao encerrar o processo; a referência fraca
+        # não impede que um monitor descartado sem close() seja coletado
+        self._atexit_flush = functools.partial(_flush_if_alive, weakref.ref(self))
+        atexit.register(self._atexit_flush)
     
     def _init_database(self):
         """Cria a tabela de histórico de tokens se não existir."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS token_usage (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
+                ts INTEGER NOT NULL,
                 user_query TEXT,
                 response_length INTEGER,
                 input_tokens INTEGER NOT NULL,
@@ -54,22 +171,83 @@ class TokenMonitor(BaseCallbackHandler):
                 model_name TEXT
             )
         """)
-        conn.commit()
-        conn.close()
+        
+        # Bancos antigos guardavam o horário como texto ISO em "timestamp"
+        cursor.execute("PRAGMA table_info(token_usage)")
+        if "ts" not in {row[1] for row in cursor.fetchall()}:
+            self._migrate_iso_timestamps(cursor)
+        
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts ON token_usage(ts)")
+        
+        # Contagens de tokens dos prefixos estáticos, reaproveitadas entre execuções
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_token_cache (
+                hash BLOB NOT NULL,
+                model TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (hash, model)
+            ) WITHOUT ROWID
+        """)
+    
+    def _migrate_iso_timestamps(self, cursor: sqlite3.Cursor):
+        """
+        Converte a coluna texto "timestamp" (ISO, horário local) para "ts"
+        (segundos Unix), que compara como inteiro e permite busca por intervalo no índice.
+        """
+        cursor.executescript("""
+            BEGIN;
+            ALTER TABLE token_usage RENAME TO token_usage_old;
+            CREATE TABLE token_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts INTEGER NOT NULL,
+                user_query TEXT,
+                response_length INTEGER,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                model_name TEXT
+            );
+            INSERT INTO token_usage
+                (id, ts, user_query, response_length, input_tokens, output_tokens, total_tokens, model_name)
+            SELECT id, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), user_query, response_length,
+                   input_tokens, output_tokens, total_tokens, model_name
+            FROM token_usage_old;
+            DROP TABLE token_usage_old;
+            COMMIT;
+        """)
     
     def set_tokenizer(self, model_name: str):
         """
         Configura o tokenizer para contagem precisa de tokens.
         
+        O carregamento ocorre em segundo plano; a primeira contagem aguarda
+        seu término.
+        
         Args:
             model_name: Nome do modelo HuggingFace
         """
+        # Contagens em cache pertencem ao tokenizer anterior
+        with self._cache_lock:
+            self._token_counts.clear()
+            for prefix in self._prefix_counts:
+                self._prefix_counts[prefix] = None
+        self.tokenizer = None
+        self.model_name = model_name
+        self._tokenizer_future = _TOKENIZER_POOL.submit(_load_tokenizer, model_name)
+    
+    def _resolve_tokenizer(self):
+        """Aguarda o carregamento iniciado por set_tokenizer, se houver."""
+        future = self._tokenizer_future
+        if future is None:
+            return
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model_name = model_name
+            self.tokenizer = future.result()
         except Exception as e:
-            print(f"Warning: Não foi possível carregar tokenizer para {model_name}: {e}")
+            print(f"Warning: Não foi possível carregar tokenizer para {self.model_name}: {e}")
             self.tokenizer = None
+        finally:
+            if self._tokenizer_future is future:
+                self._tokenizer_future = None
     
     def count_tokens(self, text: str) -> int:
         """
@@ -81,25 +259,166 @@ class TokenMonitor(BaseCallbackHandler):
         Returns:
             Número de tokens
         """
+        return self.count_tokens_batch([text])[0]
+    
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Conta tokens de vários textos com uma única chamada ao tokenizer.
+        
+        Textos já contados vêm do cache; os demais são tokenizados juntos pelo
+        caminho rápido (Rust) do tokenizer, amortizando o custo de cada chamada.
+        
+        Args:
+            texts: Textos para contar tokens
+            
+        Returns:
+            Número de tokens de cada texto, na mesma ordem
+        """
+        if self.count_fn is not None:
+            return [self.count_fn(text) for text in texts]
+        self._resolve_tokenizer()
         if self.tokenizer is None:
             # Fallback: estimativa aproximada (1 token ≈ 4 caracteres)
-            return len(text) // 4
-        return len(self.tokenizer.encode(text))
+            return [len(text) // 4 for text in texts]
+        
+        counts: List[Optional[int]] = []
+        misses: List[int] = []
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                key = _text_key(text)
+                count = self._token_counts.get(key)
+                if count is None:
+                    misses.append(i)
+                else:
+                    self._token_counts.move_to_end(key)
+                counts.append(count)
+            
+            self._token_cache_hits += len(texts) - len(misses)
+            self._token_cache_misses += len(misses)
+        
+        if misses:
+            # Tokenização fora do lock: callbacks de outras threads continuam usando o cache
+            computed = self._count_tokens_uncached([texts[i] for i in misses])
+            with self._cache_lock:
+                for i, count in zip(misses, computed):
+                    counts[i] = count
+                    self._token_counts[_text_key(texts[i])] = count
+                while len(self._token_counts) > self.TOKEN_CACHE_SIZE:
+                    self._token_counts.popitem(last=False)
+        
+        return counts
+    
+    def register_prefix(self, prefix: str):
+        """
+        Registra um prefixo invariante cuja contagem de tokens será reaproveitada.
+        
+        Args:
+            prefix: Texto que costuma iniciar os prompts (ex: system prompt)
+        """
+        with self._cache_lock:
+            self._prefix_counts[prefix] = self._prefix_counts.get(prefix)
+            self._prefix_counts.move_to_end(prefix)
+            while len(self._prefix_counts) > self.MAX_PREFIXES:
+                self._prefix_counts.popitem(last=False)
+    
+    def _count_tokens_uncached(self, texts: List[str]) -> List[int]:
+        """
+        Conta tokens com o tokenizer, sem passar pelo cache de textos idênticos.
+        
+        Tokens especiais (BOS/EOS) não são contados: os textos são trechos de
+        prompts e respostas, não sequências completas do modelo. Se um texto
+        começa com um prefixo registrado, apenas o sufixo é tokenizado e somado
+        à contagem em cache do prefixo (a fronteira entre os dois pode diferir
+        em um token da tokenização do texto inteiro).
+        """
+        counts = [0] * len(texts)
+        pending: List[tuple] = []  # (índice, texto ou sufixo após o prefixo)
+        
+        with self._cache_lock:
+            prefixes = list(self._prefix_counts)
+        
+        for i, text in enumerate(texts):
+            prefix = max((p for p in prefixes if text.startswith(p)), key=len, default=None)
+            if prefix is not None:
+                counts[i] = self._prefix_tokens(prefix)
+                text = text[len(prefix):]
+            if text:
+                pending.append((i, text))
+        
+        if pending:
+            for (i, _), length in zip(pending, self._encode_lengths([text for _, text in pending])):
+                counts[i] += length
+        
+        return counts
+    
+    def _prefix_tokens(self, prefix: str) -> int:
+        """
+        Retorna a contagem de tokens do prefixo, calculando-a uma vez por tokenizer.
+        
+        A contagem também é persistida em prompt_token_cache, indexada pelo hash
+        do conteúdo e pelo modelo, para que novas execuções não tokenizem de novo.
+        """
+        with self._cache_lock:
+            prefix_tokens = self._prefix_counts.get(prefix)
+            if prefix_tokens is not None:
+                self._prefix_counts.move_to_end(prefix)
+                return prefix_tokens
+        
+        digest = hashlib.blake2b(prefix.encode("utf-8"), digest_size=16).digest()
+        prefix_tokens = self._load_prefix_count(digest)
+        if prefix_tokens is None:
+            prefix_tokens = self._encode_lengths([prefix])[0]
+            self._store_prefix_count(digest, prefix_tokens)
+        
+        with self._cache_lock:
+            # O prefixo pode ter sido descartado por register_prefix enquanto era contado
+            if prefix in self._prefix_counts:
+                self._prefix_counts[prefix] = prefix_tokens
+                self._prefix_counts.move_to_end(prefix)
+        return prefix_tokens
+    
+    def _load_prefix_count(self, digest: bytes) -> Optional[int]:
+        """Busca no banco a contagem de um prefixo para o modelo atual."""
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT tokens FROM prompt_token_cache WHERE hash = ? AND model = ?",
+                (digest, self.model_name)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def _store_prefix_count(self, digest: bytes, tokens: int):
+        """Persiste a contagem de um prefixo para o modelo atual."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompt_token_cache (hash, model, tokens) VALUES (?, ?, ?)",
+                (digest, self.model_name, tokens)
+            )
+    
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        """Tokeniza os textos em lote e retorna apenas o número de tokens de cada um."""
+        if len(texts) == 1:
+            return [len(self.tokenizer.encode(texts[0], add_special_tokens=False).ids)]
+        # encode_batch libera o GIL e distribui os textos entre os núcleos (rayon)
+        encodings = self.tokenizer.encode_batch(texts, add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
     
     def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs):
         """Chamado quando o LLM inicia."""
         if prompts:
-            # Contar tokens de entrada
-            input_text = " ".join(prompts)
-            input_tokens = self.count_tokens(input_text)
+            # Contar tokens de entrada por prompt: evita concatenar e permite
+            # que cada um aproveite os caches de texto e de prefixo
+            input_tokens = sum(self.count_tokens_batch(prompts))
             self.current_session_tokens["input_tokens"] += input_tokens
     
     def on_llm_end(self, response: LLMResult, **kwargs):
         """Chamado quando o LLM termina."""
         if response.generations:
-            # Contar tokens de saída
-            output_text = " ".join([gen[0].text for gen in response.generations if gen])
-            output_tokens = self.count_tokens(output_text)
+            # Contar tokens de saída por geração, sem concatenar os textos
+            output_tokens = sum(self.count_tokens_batch([gen[0].text for gen in response.generations if gen]))
             self.current_session_tokens["output_tokens"] += output_tokens
             self.current_session_tokens["total_tokens"] = (
                 self.current_session_tokens["input_tokens"] + 
@@ -112,38 +431,106 @@ class TokenMonitor(BaseCallbackHandler):
         """
         Registra uma query completa no banco de dados.
         
+        Os registros são acumulados e gravados em lote a cada FLUSH_THRESHOLD
+        queries ou por um timer até FLUSH_INTERVAL segundos após o primeiro
+        registro pendente, além de em get_report, em flush() e em close().
+        
         Args:
             user_query: Pergunta do usuário
             response_text: Resposta do agente
             input_tokens: Tokens de entrada (se None, calcula automaticamente)
             output_tokens: Tokens de saída (se None, calcula automaticamente)
         """
+        row = self._make_row(user_query, response_text, input_tokens, output_tokens)
+        with self._lock:
+            self._pending.append(row)
+            self.current_session_tokens["queries"] += 1
+            should_flush = len(self._pending) >= self.FLUSH_THRESHOLD
+            if not should_flush and self._flush_timer is None and self._conn is not None:
+                self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self._timed_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        
+        if should_flush:
+            self.flush()
+    
+    def _timed_flush(self):
+        """Executado pelo timer: grava os registros acumulados desde o agendamento."""
+        with self._lock:
+            self._flush_timer = None
+        self.flush()
+    
+    def log_queries_batch(self, rows: List[Tuple[str, str, Optional[int], Optional[int]]]):
+        """
+        Registra várias queries de uma vez, gravando-as em uma única transação.
+        
+        Args:
+            rows: Tuplas (user_query, response_text, input_tokens, output_tokens);
+                tokens None são calculados automaticamente
+        """
+        prepared = [self._make_row(*row) for row in rows]
+        with self._lock:
+            self._pending.extend(prepared)
+            self.current_session_tokens["queries"] += len(rows)
+        self.flush()
+    
+    def _make_row(self, user_query: str, response_text: str,
+                  input_tokens: Optional[int], output_tokens: Optional[int]) -> tuple:
+        """Monta a linha a inserir em token_usage, contando os tokens ausentes."""
         if input_tokens is None:
             input_tokens = self.count_tokens(user_query)
         if output_tokens is None:
             output_tokens = self.count_tokens(response_text)
         
-        total_tokens = input_tokens + output_tokens
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO token_usage 
-            (timestamp, user_query, response_length, input_tokens, output_tokens, total_tokens, model_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.now().isoformat(),
+        return (
+            int(time.time()),
             user_query,
             len(response_text),
             input_tokens,
             output_tokens,
-            total_tokens,
+            input_tokens + output_tokens,
             self.model_name
-        ))
-        conn.commit()
-        conn.close()
-        
-        self.current_session_tokens["queries"] += 1
+        )
+    
+    def flush(self):
+        """Grava no banco, em uma única transação, os registros pendentes."""
+        with self._lock:
+            if not self._pending or self._conn is None:
+                return
+            
+            rows, self._pending = self._pending, []
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN")
+            try:
+                cursor.executemany("""
+                    INSERT INTO token_usage 
+                    (ts, user_query, response_length, input_tokens, output_tokens, total_tokens, model_name)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            except Exception:
+                cursor.execute("ROLLBACK")
+                self._pending = rows + self._pending
+                raise
+            cursor.execute("COMMIT")
+    
+    def close(self):
+        """Grava os registros pendentes e fecha a conexão com o banco."""
+        self.flush()
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._conn is None:
+                return
+            self._conn.close()
+            self._conn = None
+        atexit.unregister(self._atexit_flush)
+    
+    def __enter__(self) -> "TokenMonitor":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def get_session_stats(self) -> Dict[str, Any]:
         """
@@ -156,48 +543,62 @@ class TokenMonitor(BaseCallbackHandler):
             "input_tokens": self.current_session_tokens["input_tokens"],
             "output_tokens": self.current_session_tokens["output_tokens"],
             "total_tokens": self.current_session_tokens["total_tokens"],
-            "queries": self.current_session_tokens["queries"]
+            "queries": self.current_session_tokens["queries"],
+            "token_cache_hits": self._token_cache_hits,
+            "token_cache_misses": self._token_cache_misses
         }
     
-    def get_report(self, limit: int = 100, start_date: Optional[str] = None, 
-                   end_date: Optional[str] = None) -> Dict[str, Any]:
+    def get_report(self, limit: int = 100, start_date: Optional[int] = None, 
+                   end_date: Optional[int] = None) -> Dict[str, Any]:
         """
         Gera relatório agregado de uso de tokens.
         
         Args:
             limit: Número máximo de registros a retornar
-            start_date: Data inicial (ISO format)
-            end_date: Data final (ISO format)
+            start_date: Data inicial (segundos Unix, ex: int(time.time()) - 86400)
+            end_date: Data final (segundos Unix)
             
         Returns:
             Dicionário com estatísticas agregadas
+            
+        Raises:
+            TypeError: Se start_date/end_date não forem inteiros (ex: datas ISO)
+            RuntimeError: Se o monitor já tiver sido fechado
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM token_usage WHERE 1=1"
-        params = []
+        # Strings ISO comparariam como TEXT com a coluna INTEGER e dariam totais errados
+        for bound in (start_date, end_date):
+            if bound is not None and not isinstance(bound, int):
+                raise TypeError(
+                    f"start_date/end_date devem ser segundos Unix (int), recebido {type(bound).__name__}"
+                )
         
-        if start_date:
-            query += " AND timestamp >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND timestamp <= ?"
-            params.append(end_date)
+        self.flush()
+        if self._conn is None:
+            raise RuntimeError("TokenMonitor já foi fechado")
         
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limit)
+        # SQL estático com filtros opcionais via COALESCE: o sqlite3 reaproveita o
+        # statement preparado em vez de recompilar a cada combinação de filtros
+        params = (start_date, end_date)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        # Calcular estatísticas
-        total_input = sum(row[5] for row in rows)  # input_tokens
-        total_output = sum(row[6] for row in rows)  # output_tokens
-        total_tokens = sum(row[7] for row in rows)  # total_tokens
-        total_queries = len(rows)
-        
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            # Agregados calculados pelo SQLite sobre os `limit` registros mais recentes
+            cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0), "
+                "COALESCE(SUM(total_tokens), 0) FROM (SELECT input_tokens, output_tokens, total_tokens "
+                f"FROM token_usage {self._REPORT_WHERE} ORDER BY ts DESC LIMIT ?)",
+                params + (limit,)
+            )
+            total_queries, total_input, total_output, total_tokens = cursor.fetchone()
+            
+            # Apenas as colunas exibidas das últimas 10 queries
+            cursor.execute(
+                "SELECT ts, user_query, input_tokens, output_tokens, total_tokens "
+                f"FROM token_usage {self._REPORT_WHERE} ORDER BY ts DESC LIMIT ?",
+                params + (min(limit, 10),)
+            )
+            recent_rows = cursor.fetchall()
         
         return {
             "total_queries": total_queries,
@@ -207,13 +608,13 @@ class TokenMonitor(BaseCallbackHandler):
             "average_tokens_per_query": total_tokens / total_queries if total_queries > 0 else 0,
             "recent_queries": [
                 {
-                    "timestamp": row[1],
-                    "query": row[2],
-                    "input_tokens": row[5],
-                    "output_tokens": row[6],
-                    "total_tokens": row[7]
+                    "timestamp": datetime.fromtimestamp(row[0]).isoformat(),
+                    "query": row[1],
+                    "input_tokens": row[2],
+                    "output_tokens": row[3],
+                    "total_tokens": row[4]
                 }
-                for row in rows[:10]  # Últimas 10 queries
+                for row in recent_rows
             ]
         }
     
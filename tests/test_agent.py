@@ -3,7 +3,18 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
 import os
-from src.agent import setup_github_toolkit, create_agent
+import tempfile
+import requests
+from types import SimpleNamespace
+from langchain_community.utilities.github import GitHubAPIWrapper
+# Alias para que o pytest não colete a função como teste
+from src.agent import test_github_connection as check_github_connection
+from src.agent import (
+    setup_github_toolkit, create_agent, PersonalTokenGitHubAPIWrapper,
+    _RepairingReActParser, _StopOnSubstrings, REACT_STOP_SEQUENCES
+)
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
 from src.token_monitor import TokenMonitor
 
 
@@ -43,17 +54,184 @@ class TestAgent(unittest.TestCase):
         mock_llm_instance = Mock()
         mock_llm.return_value = mock_llm_instance
         
-        try:
-            agent = create_agent(
-                model_name="test-model",
-                token_monitor=TokenMonitor(model_name="test-model")
-            )
-            # Se chegou aqui, o agente foi criado
-            self.assertIsNotNone(agent)
-        except Exception as e:
-            # Pode falhar em algumas dependências, mas estrutura deve estar correta
-            # Verificar que não é erro de configuração básica
-            self.assertNotIn("GITHUB_TOKEN não encontrado", str(e))
+        # Banco temporário para não gravar em data/token_usage.db
+        with tempfile.TemporaryDirectory() as test_dir, TokenMonitor(
+            db_path=os.path.join(test_dir, "token_usage.db"), model_name="test-model"
+        ) as token_monitor:
+            try:
+                agent = create_agent(
+                    model_name="test-model",
+                    token_monitor=token_monitor
+                )
+                # Se chegou aqui, o agente foi criado
+                self.assertIsNotNone(agent)
+            except Exception as e:
+                # Pode falhar em algumas dependências, mas estrutura deve estar correta
+                # Verificar que não é erro de configuração básica
+                self.assertNotIn("GITHUB_TOKEN não encontrado", str(e))
+
+
+    
+    @patch("src.agent.requests.head")
+    def test_github_connection(self, mock_head):
+        """Testa a verificação de conexão para sucesso, token inválido e erro de rede."""
+        mock_head.return_value = Mock(status_code=200)
+        self.assertTrue(check_github_connection("owner", "repo", "test_token"))
+        self.assertEqual(
+            mock_head.call_args.kwargs["headers"], {"Authorization": "Bearer test_token"}
+        )
+        
+        mock_head.return_value = Mock(status_code=401)
+        self.assertFalse(check_github_connection("owner", "repo", "test_token"))
+        
+        mock_head.side_effect = requests.ConnectionError("sem rede")
+        self.assertFalse(check_github_connection("owner", "repo", "test_token"))
+
+
+@patch.object(GitHubAPIWrapper, "get_issue", return_value={"number": 1, "source": "api"})
+class TestPrefetch(unittest.TestCase):
+    """Testes para o pré-carregamento de detalhes de issues/PRs."""
+    
+    def setUp(self):
+        """Configuração antes de cada teste."""
+        # model_construct evita a validação, que consultaria a API do GitHub
+        self.wrapper = PersonalTokenGitHubAPIWrapper.model_construct(prefetch_limit=2)
+        self.fetch = Mock(return_value={"number": 1, "source": "prefetch"})
+    
+    def test_prefetch_hit_is_taken_once(self, mock_get_issue):
+        """Testa que o pré-carregamento é usado uma única vez e depois a API é consultada."""
+        self.wrapper._prefetch("issue", self.fetch, [1, 2, 3])
+        
+        self.assertEqual(self.wrapper.get_issue(1)["source"], "prefetch")
+        mock_get_issue.assert_not_called()
+        self.assertEqual(self.wrapper.get_issue(1)["source"], "api")
+        self.assertEqual(self.fetch.call_count, 2)  # apenas os prefetch_limit primeiros
+    
+    def test_failed_prefetch_falls_back(self, mock_get_issue):
+        """Testa que uma busca antecipada com erro recorre à chamada normal."""
+        self.fetch.side_effect = RuntimeError("rate limit")
+        self.wrapper._prefetch("issue", self.fetch, [1])
+        
+        self.assertEqual(self.wrapper.get_issue(1)["source"], "api")
+    
+    def test_expired_prefetch_is_discarded(self, mock_get_issue):
+        """Testa que pré-carregamentos mais antigos que prefetch_ttl não são servidos."""
+        with patch("src.agent.time.monotonic", return_value=1000.0):
+            self.wrapper._prefetch("issue", self.fetch, [1])
+        
+        with patch("src.agent.time.monotonic", return_value=1000.0 + self.wrapper.prefetch_ttl + 1):
+            self.assertEqual(self.wrapper.get_issue(1)["source"], "api")
+
+
+class TestRepairingReActParser(unittest.TestCase):
+    """Testes para o parser ReAct com reparo de formato."""
+    
+    def setUp(self):
+        """Configuração antes de cada teste."""
+        self.parser = _RepairingReActParser()
+    
+    def test_missing_newline(self):
+        """Testa ação e entrada na mesma linha do pensamento."""
+        result = self.parser.parse("Vou listar as issues Action: Get Issues Action Input: abertas")
+        
+        self.assertIsInstance(result, AgentAction)
+        self.assertEqual((result.tool, result.tool_input), ("Get Issues", "abertas"))
+    
+    def test_trailing_observation_after_action(self):
+        """Testa que a Observation inventada após o Action Input é descartada."""
+        result = self.parser.parse(
+            "Thought: preciso da issue\nAction: Get Issue\nAction Input: 42\n"
+            "Observation: inventada\nThought: pronto"
+        )
+        
+        self.assertIsInstance(result, AgentAction)
+        self.assertEqual((result.tool, result.tool_input), ("Get Issue", "42"))
+    
+    def test_multiline_final_answer(self):
+        """Testa que linhas da resposta final parecidas com marcadores ReAct são mantidas."""
+        result = self.parser.parse(
+            "Thought: Agora sei a resposta final\nFinal Answer: Passos:\nAction: clicar em X\nThought: fim"
+        )
+        
+        self.assertIsInstance(result, AgentFinish)
+        self.assertEqual(result.return_values["output"], "Passos:\nAction: clicar em X\nThought: fim")
+    
+    def _generate_until_stop(self, prompt, continuation):
+        """Simula o pipeline local: gera caractere a caractere até o critério de parada disparar."""
+        fake_torch = SimpleNamespace(bool="bool", tensor=lambda data, dtype, device: data)
+        with patch("src.agent._get_torch", return_value=fake_torch):
+            criteria = _StopOnSubstrings(_CharTokenizer(), REACT_STOP_SEQUENCES)
+        
+        generated = ""
+        for char in continuation:
+            generated += char
+            if criteria(_FakeIds([_FakeRow(ord(c) for c in prompt + generated)]), scores=None)[0]:
+                break
+        return generated
+    
+    def test_stop_sequence_left_by_local_pipeline(self):
+        """Testa que o marcador de parada deixado no fim da geração não chega à ferramenta."""
+        prompt = "Question: Quem abriu a issue 12?\nThought:"
+        
+        text = self._generate_until_stop(
+            prompt, " I should list issues\nAction: Get Issue\nAction Input: 12\nObservation: inventada"
+        )
+        self.assertTrue(text.endswith("\nObservation"))
+        result = self.parser.parse(text)
+        self.assertEqual((result.tool, result.tool_input), ("Get Issue", "12"))
+        
+        text = self._generate_until_stop(prompt, " ok\nAction: Get Issues\nAction Input:\nObservation: x")
+        self.assertEqual(self.parser.parse(text).tool_input, "")
+        
+        text = self._generate_until_stop(prompt, " pronto\nFinal Answer: Fulano\nQuestion: outra")
+        self.assertTrue(text.endswith("\nQuestion:"))
+        self.assertEqual(self.parser.parse(text).return_values["output"], "Fulano")
+    
+    def test_no_match_passes_through(self):
+        """Testa que saídas fora da gramática seguem para o parser padrão."""
+        with self.assertRaises(OutputParserException):
+            self.parser.parse("Não sei o que fazer agora.")
+
+
+class _CharTokenizer:
+    """Tokenizer falso: cada caractere é um token."""
+    
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids)
+
+
+class _FakeIds(list):
+    """Lote de sequências no formato esperado pelo critério de parada (list + .device)."""
+    
+    device = "cpu"
+
+
+class _FakeRow(list):
+    def tolist(self):
+        return list(self)
+
+
+class TestStopOnSubstrings(unittest.TestCase):
+    """Testes para o critério de parada do pipeline local."""
+    
+    def setUp(self):
+        """Configuração antes de cada teste."""
+        fake_torch = SimpleNamespace(bool="bool", tensor=lambda data, dtype, device: data)
+        with patch("src.agent._get_torch", return_value=fake_torch):
+            self.criteria = _StopOnSubstrings(_CharTokenizer(), REACT_STOP_SEQUENCES)
+    
+    def _stop(self, text):
+        return self.criteria(_FakeIds([_FakeRow(ord(c) for c in text)]), scores=None)[0]
+    
+    def test_marker_in_prompt_does_not_stop(self):
+        """Testa que um marcador já presente no prompt não encerra a geração."""
+        self.assertFalse(self._stop("Action: x\nObservation: y"))
+        self.assertFalse(self._stop("\nObservation: y\nThought"))
+    
+    def test_marker_completed_by_new_token_stops(self):
+        """Testa que o marcador completado pelo token novo encerra a geração."""
+        self.assertTrue(self._stop("Action Input: 1\nObservation"))
+        self.assertTrue(self._stop("Final Answer: ok\nQuestion:"))
 
 
 if __name__ == "__main__":
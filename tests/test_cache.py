@@ -0,0 +1,262 @@
+"""Testes para o QueryCache."""
+
+import unittest
+import importlib.util
+import os
+import tempfile
+import shutil
+from types import SimpleNamespace
+from unittest.mock import patch
+from src.cache import QueryCache, SemanticQueryCache, _SemanticNamespace
+
+
+class TestQueryCache(unittest.TestCase):
+    """Testes para a classe QueryCache."""
+    
+    def setUp(self):
+        """Configuração antes de cada teste."""
+        self.cache = QueryCache(ttl_seconds=60, maxsize=3, num_shards=1)
+    
+    def test_set_and_get(self):
+        """Testa armazenamento e recuperação de valores."""
+        self.cache.set("Quais issues abertas?", "owner", "repo", "resposta")
+        
+        self.assertEqual(self.cache.get("Quais issues abertas?", "owner", "repo"), "resposta")
+        self.assertIsNone(self.cache.get("Quais issues abertas?", "owner", "outro-repo"))
+    
+    def test_normalized_query(self):
+        """Testa que variações de caixa, espaços e forma Unicode usam a mesma entrada."""
+        self.cache.set("Quais issues abertas?", "owner", "repo", "resposta")
+        
+        self.assertEqual(self.cache.get("  quais   ISSUES abertas? ", "owner", "repo"), "resposta")
+        self.assertEqual(
+            self.cache.get("Quais issues abertas?", "owner", "repo"),
+            self.cache.get("Quais\u00a0issues abertas?", "owner", "repo")
+        )
+    
+    def test_expired_entry(self):
+        """Testa que entradas expiradas não são retornadas."""
+        self.cache.set("Query", "owner", "repo", "resposta")
+        
+        with patch("src.cache.time.monotonic", return_value=10**12):
+            self.assertIsNone(self.cache.get("Query", "owner", "repo"))
+            self.assertEqual(self.cache.get_stats()["total_entries"], 0)
+    
+    def test_lru_eviction(self):
+        """Testa descarte da entrada menos usada ao exceder maxsize."""
+        for i in range(3):
+            self.cache.set(f"Query {i}", "owner", "repo", i)
+        
+        # Acessar a primeira para torná-la a mais recente
+        self.cache.get("Query 0", "owner", "repo")
+        self.cache.set("Query 3", "owner", "repo", 3)
+        
+        self.assertEqual(self.cache.get("Query 0", "owner", "repo"), 0)
+        self.assertIsNone(self.cache.get("Query 1", "owner", "repo"))
+        self.assertEqual(self.cache.get_stats()["total_entries"], 3)
+    
+    def test_clear_expired_after_access(self):
+        """Testa que entradas expiradas são removidas mesmo atrás de uma entrada acessada."""
+        cache = QueryCache(ttl_seconds=100, num_shards=1)
+        with patch("src.cache.time.monotonic", return_value=0.0):
+            cache.set("A", "owner", "repo", "a")
+        with patch("src.cache.time.monotonic", return_value=50.0):
+            cache.set("B", "owner", "repo", "b")
+        with patch("src.cache.time.monotonic", return_value=60.0):
+            cache.get("A", "owner", "repo")
+        
+        with patch("src.cache.time.monotonic", return_value=120.0):
+            self.assertEqual(cache.get_stats()["total_entries"], 1)
+            self.assertEqual(cache.get("B", "owner", "repo"), "b")
+
+    def test_sharded_cache(self):
+        """Testa cache com múltiplos shards e validação do número de shards."""
+        cache = QueryCache(ttl_seconds=60, maxsize=1024, num_shards=16)
+        for i in range(32):
+            cache.set(f"Query {i}", "owner", "repo", i)
+        
+        self.assertEqual([cache.get(f"Query {i}", "owner", "repo") for i in range(32)], list(range(32)))
+        
+        cache.clear()
+        self.assertEqual(cache.get_stats()["total_entries"], 0)
+        
+        with self.assertRaises(ValueError):
+            QueryCache(num_shards=3)
+
+    def test_maxsize_is_global(self):
+        """Testa que maxsize limita o total de entradas somando todos os shards."""
+        cache = QueryCache(ttl_seconds=100, maxsize=4, num_shards=16)
+        for i in range(40):
+            cache.set(f"Query {i}", "owner", "repo", i)
+        
+        self.assertEqual(cache.get_stats()["total_entries"], 4)
+        self.assertEqual(cache.get("Query 39", "owner", "repo"), 39)
+    
+    def test_persistent_cache(self):
+        """Testa reaproveitamento de entradas persistidas em SQLite entre instâncias."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(test_dir, "query_cache.db")
+            cache = QueryCache(ttl_seconds=60, db_path=db_path)
+            cache.set("Query", "owner", "repo", {"output": "resposta"})
+            cache.close()
+            
+            reopened = QueryCache(ttl_seconds=60, db_path=db_path)
+            self.assertEqual(reopened.get("Query", "owner", "repo"), {"output": "resposta"})
+            
+            reopened.clear()
+            self.assertIsNone(reopened.get("Query", "owner", "repo"))
+            reopened.close()
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_expired_rows_purged_on_open(self):
+        """Testa que linhas expiradas de execuções anteriores são removidas ao abrir o banco."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(test_dir, "query_cache.db")
+            cache = QueryCache(ttl_seconds=60, db_path=db_path)
+            cache.set("Query", "owner", "repo", "resposta")
+            cache.close()
+
+            with patch("src.cache.time.time", return_value=10**12):
+                reopened = QueryCache(ttl_seconds=60, db_path=db_path)
+            count = reopened._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+            reopened.close()
+            self.assertEqual(count, 0)
+        finally:
+            shutil.rmtree(test_dir)
+
+
+
+# Embeddings fixos por pergunta normalizada
+_VECTORS = {
+    "quais issues abertas?": [1.0, 0.0, 0.0, 0.0],
+    "liste as issues abertas": [0.99, 0.14, 0.0, 0.0],
+    "status da issue #123": [0.0, 1.0, 0.0, 0.0],
+    "status da issue #124": [0.0, 1.0, 0.0, 0.0],
+    "qual o status da issue #123?": [0.0, 0.99, 0.14, 0.0],
+    "quem mantém o projeto?": [0.0, 0.0, 1.0, 0.0],
+    "quem são os mantenedores?": [0.0, 0.14, 0.99, 0.0],
+    "qual a licença?": [0.0, 0.0, 0.0, 1.0],
+    "qual é a licença?": [0.0, 0.0, 0.14, 0.99],
+}
+
+
+def _embed(text):
+    return _VECTORS.get(text, [1.0, 1.0, 1.0, 1.0])
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy não instalado")
+class TestSemanticQueryCache(unittest.TestCase):
+    """Testes para a camada semântica do cache."""
+    
+    def setUp(self):
+        """Configuração antes de cada teste."""
+        self.cache = SemanticQueryCache(QueryCache(ttl_seconds=60), ttl_seconds=60, embed_fn=_embed)
+    
+    def test_similar_query_hit(self):
+        """Testa que uma paráfrase acima do limiar reutiliza a resposta."""
+        self.cache.set("Quais issues abertas?", "owner", "repo", "resposta")
+        
+        self.assertEqual(self.cache.get("Liste as issues abertas", "owner", "repo"), "resposta")
+    
+    def test_dissimilar_query_miss(self):
+        """Testa que perguntas abaixo do limiar não compartilham resposta."""
+        self.cache.set("Quem mantém o projeto?", "owner", "repo", "resposta")
+        
+        self.assertIsNone(self.cache.get("Liste as issues abertas", "owner", "repo"))
+    
+    def test_identifiers_must_match(self):
+        """Testa que perguntas sobre outro número de issue não reutilizam a resposta."""
+        self.cache.set("Status da issue #123", "owner", "repo", "resposta")
+        
+        self.assertIsNone(self.cache.get("Status da issue #124", "owner", "repo"))
+        self.assertEqual(self.cache.get("Qual o status da issue #123?", "owner", "repo"), "resposta")
+    
+    def test_repo_isolation(self):
+        """Testa que o índice semântico é separado por repositório."""
+        self.cache.set("Quais issues abertas?", "owner", "repo", "resposta")
+        
+        self.assertIsNone(self.cache.get("Liste as issues abertas", "owner", "outro-repo"))
+    
+    def test_expired_entry(self):
+        """Testa que entradas semânticas expiradas não são retornadas."""
+        with patch("src.cache.time.monotonic", return_value=1000.0):
+            self.cache.set("Quais issues abertas?", "owner", "repo", "resposta")
+        
+        with patch("src.cache.time.monotonic", return_value=1030.0):
+            self.assertEqual(self.cache.get("Liste as issues abertas", "owner", "repo"), "resposta")
+        with patch("src.cache.time.monotonic", return_value=1061.0):
+            self.assertIsNone(self.cache.get("Liste as issues abertas", "owner", "repo"))
+    
+    def test_compaction_at_maxsize(self):
+        """Testa que o índice descarta as entradas mais antigas ao exceder maxsize."""
+        cache = SemanticQueryCache(
+            QueryCache(ttl_seconds=60, maxsize=2, num_shards=1), ttl_seconds=60, embed_fn=_embed
+        )
+        cache.set("Quem mantém o projeto?", "owner", "repo", "mantenedores")
+        cache.set("Qual a licença?", "owner", "repo", "licença")
+        cache.set("Outra pergunta", "owner", "repo", "outra")
+        
+        self.assertEqual(cache.get_stats()["semantic_entries"], 2)
+        self.assertIsNone(cache.get("Quem são os mantenedores?", "owner", "repo"))
+        self.assertEqual(cache.get("Qual é a licença?", "owner", "repo"), "licença")
+
+    
+    def test_namespaces_bounded_by_maxsize(self):
+        """Testa que o total de entradas semânticas entre todos os índices respeita maxsize."""
+        cache = SemanticQueryCache(
+            QueryCache(ttl_seconds=60, maxsize=4, num_shards=1), ttl_seconds=60, embed_fn=_embed
+        )
+        for i in range(10):
+            cache.set(f"Status da issue #{i + 100}", "owner", "repo", i)
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats["semantic_entries"], 4)
+        self.assertEqual(stats["semantic_namespaces"], 4)
+        self.assertEqual(cache.get("Qual o status da issue #109?", "owner", "repo"), 9)
+        self.assertIsNone(cache.get("Qual o status da issue #100?", "owner", "repo"))
+    
+    def test_expired_namespaces_removed(self):
+        """Testa que índices sem entradas válidas são removidos por clear_expired."""
+        with patch("src.cache.time.monotonic", return_value=1000.0):
+            for i in range(5):
+                self.cache.set(f"Status da issue #{i + 100}", "owner", "repo", i)
+        
+        with patch("src.cache.time.monotonic", return_value=1061.0):
+            self.cache.clear_expired()
+            stats = self.cache.get_stats()
+        self.assertEqual(stats["semantic_entries"], 0)
+        self.assertEqual(stats["semantic_namespaces"], 0)
+    
+    def test_faiss_search_skips_expired_neighbors(self):
+        """Testa que vizinhos expirados no topo do índice faiss não escondem uma entrada válida."""
+        import numpy as np
+        
+        class FakeIndexFlatIP:
+            def __init__(self, dim):
+                self.embs = np.empty((0, dim), dtype=np.float32)
+            
+            def add(self, embs):
+                self.embs = np.vstack([self.embs, embs])
+            
+            def search(self, queries, k):
+                scores = queries @ self.embs.T
+                ids = np.argsort(-scores, axis=1)[:, :k]
+                return np.take_along_axis(scores, ids, axis=1), ids
+        
+        with patch("src.cache._faiss", SimpleNamespace(IndexFlatIP=FakeIndexFlatIP)):
+            namespace = _SemanticNamespace(2)
+            for i in range(_SemanticNamespace.SEARCH_K + 1):
+                namespace.add(np.array([1.0, 0.0], dtype=np.float32), f"expirada {i}", 0.0)
+            live = np.array([0.96, 0.28], dtype=np.float32)
+            namespace.add(live, "válida", 100.0)
+            
+            query = np.array([1.0, 0.0], dtype=np.float32)
+            self.assertEqual(namespace.search(query, 0.92, min_timestamp=50.0), "válida")
+            self.assertIsNone(namespace.search(query, 0.99, min_timestamp=50.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
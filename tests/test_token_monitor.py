@@ -4,7 +4,17 @@ import unittest
 import os
 import tempfile
 import shutil
+import sqlite3
+import sys
+import threading
+import time
+import gc
+import weakref
+from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock
+from src.prompts import get_system_prompt_with_examples
 from src.token_monitor import TokenMonitor
 
 
@@ -16,10 +26,15 @@ class TestTokenMonitor(unittest.TestCase):
         # Criar diretório temporário para banco de dados
         self.test_dir = tempfile.mkdtemp()
         self.db_path = os.path.join(self.test_dir, "test_token_usage.db")
-        self.monitor = TokenMonitor(db_path=self.db_path, model_name="test-model")
+        self.monitor = TokenMonitor(
+            db_path=self.db_path,
+            model_name="test-model",
+            count_fn=lambda text: len(text) // 4
+        )
     
     def tearDown(self):
         """Limpeza após cada teste."""
+        self.monitor.close()
         # Remover diretório temporário
         if os.path.exists(self.test_dir):
             shutil.rmtree(self.test_dir)
@@ -30,18 +45,65 @@ class TestTokenMonitor(unittest.TestCase):
     
     def test_count_tokens_without_tokenizer(self):
         """Testa contagem de tokens sem tokenizer (fallback)."""
+        self.monitor.count_fn = None
         text = "Hello world, this is a test."
         tokens = self.monitor.count_tokens(text)
         # Fallback usa estimativa (1 token ≈ 4 caracteres)
         self.assertGreater(tokens, 0)
         self.assertLess(tokens, len(text))
     
+    def test_count_tokens_uses_count_fn(self):
+        """Testa que o contador injetado substitui o tokenizer."""
+        self.monitor.count_fn = Mock(return_value=7)
+        self.monitor.tokenizer = Mock()
+        
+        self.assertEqual(self.monitor.count_tokens_batch(["a", "b"]), [7, 7])
+        self.monitor.tokenizer.encode.assert_not_called()
+    
+    def test_count_tokens_reuses_prefix(self):
+        """Testa que apenas o sufixo após um prefixo conhecido é tokenizado."""
+        tokenizer = Mock()
+        tokenizer.encode.side_effect = lambda text, **kwargs: Mock(ids=text.split())
+        self.monitor.count_fn = None
+        tokenizer.encode_batch.side_effect = lambda texts, **kwargs: [Mock(ids=t.split()) for t in texts]
+        self.monitor.tokenizer = tokenizer
+        prompt = get_system_prompt_with_examples()
+        
+        text = prompt + " Quais issues abertas?"
+        self.assertEqual(self.monitor.count_tokens(text), len(text.split()))
+        
+        self.monitor.count_tokens(prompt + " Quem abriu a issue #1?")
+        self.assertEqual(tokenizer.encode.call_args.args[0], " Quem abriu a issue #1?")
+        
+        counts = self.monitor.count_tokens_batch([prompt + " Olá", "Outro texto aqui"])
+        self.assertEqual(counts, [len(prompt.split()) + 1, 3])
+        self.assertEqual(tokenizer.encode_batch.call_args.args[0], [" Olá", "Outro texto aqui"])
+    
+    def test_prefix_count_persisted(self):
+        """Testa que a contagem do prefixo é reaproveitada entre instâncias."""
+        prompt = get_system_prompt_with_examples()
+        self.monitor.count_fn = None
+        self.monitor.tokenizer = Mock()
+        self.monitor.tokenizer.encode.side_effect = lambda text, **kwargs: Mock(ids=text.split())
+        self.monitor.count_tokens(prompt + " Quais issues abertas?")
+        
+        tokenizer = Mock()
+        tokenizer.encode.side_effect = lambda text, **kwargs: Mock(ids=text.split())
+        with TokenMonitor(db_path=self.db_path, model_name="test-model") as monitor:
+            monitor.tokenizer = tokenizer
+            text = prompt + " Quem abriu a issue #1?"
+            self.assertEqual(monitor.count_tokens(text), len(text.split()))
+        
+        tokenizer.encode.assert_called_once()
+        self.assertEqual(tokenizer.encode.call_args.args[0], " Quem abriu a issue #1?")
+    
     def test_log_query(self):
         """Testa registro de query no banco."""
         query = "Test query"
         response = "Test response"
         
         self.monitor.log_query(query, response, input_tokens=10, output_tokens=20)
+        self.monitor.flush()
         
         # Verificar se foi salvo
         import sqlite3
@@ -53,6 +115,60 @@ class TestTokenMonitor(unittest.TestCase):
         
         self.assertEqual(count, 1)
     
+    def test_log_query_flushes_on_timer(self):
+        """Testa que um registro pendente é gravado pelo timer, sem novas chamadas."""
+        self.monitor.FLUSH_INTERVAL = 0.05
+        self.monitor.log_query("Query", "Response", input_tokens=10, output_tokens=20)
+        
+        # Outra conexão, como a de show_token_report.py em outro processo
+        conn = sqlite3.connect(self.db_path)
+        try:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if conn.execute("SELECT COUNT(*) FROM token_usage").fetchone()[0] == 1:
+                    break
+                time.sleep(0.02)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM token_usage").fetchone()[0], 1)
+        finally:
+            conn.close()
+    
+    def test_concurrent_counting_and_logging(self):
+        """Testa contagem e registro simultâneos em várias threads."""
+        class SplitTokenizer:
+            def encode(self, text, add_special_tokens=False):
+                return SimpleNamespace(ids=text.split())
+            
+            def encode_batch(self, texts, add_special_tokens=False):
+                return [self.encode(text) for text in texts]
+        
+        self.monitor.count_fn = None
+        self.monitor.tokenizer = SplitTokenizer()
+        self.monitor.TOKEN_CACHE_SIZE = 4
+        errors = []
+        
+        def worker(n):
+            try:
+                for i in range(200):
+                    self.assertEqual(self.monitor.count_tokens(f"texto {n} {i % 7}"), 3)
+                    self.monitor.log_query(f"Query {n}", "Response", input_tokens=1, output_tokens=2)
+            except Exception as e:
+                errors.append(e)
+        
+        # Trocas de thread frequentes tornam as condições de corrida reproduzíveis
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(self.monitor.get_report(limit=10000)["total_queries"], 1600)
+    
     def test_get_session_stats(self):
         """Testa obtenção de estatísticas da sessão."""
         stats = self.monitor.get_session_stats()
@@ -65,13 +181,10 @@ class TestTokenMonitor(unittest.TestCase):
     def test_get_report(self):
         """Testa geração de relatório."""
         # Adicionar algumas queries
-        for i in range(5):
-            self.monitor.log_query(
-                f"Query {i}",
-                f"Response {i}",
-                input_tokens=10 + i,
-                output_tokens=20 + i
-            )
+        self.monitor.log_queries_batch([
+            (f"Query {i}", f"Response {i}", 10 + i, 20 + i)
+            for i in range(5)
+        ])
         
         report = self.monitor.get_report(limit=10)
         
@@ -79,6 +192,69 @@ class TestTokenMonitor(unittest.TestCase):
         self.assertGreater(report["total_tokens"], 0)
         self.assertEqual(len(report["recent_queries"]), 5)
     
+    def test_get_report_date_range(self):
+        """Testa filtro de período do relatório."""
+        self.monitor.log_queries_batch([("Query", "Response", 10, 20)])
+        now = int(time.time())
+        
+        self.assertEqual(self.monitor.get_report(start_date=now - 60)["total_queries"], 1)
+        self.assertEqual(self.monitor.get_report(end_date=now - 60)["total_queries"], 0)
+    
+    def test_get_report_rejects_iso_dates(self):
+        """Testa que datas ISO (formato antigo) são recusadas em get_report."""
+        with self.assertRaises(TypeError):
+            self.monitor.get_report(start_date="2024-01-01T00:00:00")
+    
+    def test_get_report_after_close(self):
+        """Testa que get_report após close() gera um erro claro."""
+        self.monitor.close()
+        
+        with self.assertRaises(RuntimeError):
+            self.monitor.get_report()
+    
+    def test_unclosed_monitor_is_collected(self):
+        """Testa que o registro no atexit não mantém vivo um monitor descartado."""
+        monitor = TokenMonitor(db_path=os.path.join(self.test_dir, "other.db"), count_fn=len)
+        monitor_ref = weakref.ref(monitor)
+        del monitor
+        gc.collect()
+        
+        self.assertIsNone(monitor_ref())
+    
+    def test_migrate_iso_timestamps(self):
+        """Testa a migração de bancos com a coluna texto "timestamp" para "ts"."""
+        db_path = os.path.join(self.test_dir, "legacy_token_usage.db")
+        logged_at = datetime(2024, 1, 2, 3, 4, 5)
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE token_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                user_query TEXT,
+                response_length INTEGER,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                model_name TEXT
+            )
+        """)
+        conn.execute(
+            "INSERT INTO token_usage (timestamp, user_query, response_length, input_tokens, "
+            "output_tokens, total_tokens, model_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (logged_at.isoformat(), "Query antiga", 8, 10, 20, 30, "test-model")
+        )
+        conn.commit()
+        conn.close()
+        
+        with TokenMonitor(db_path=db_path, model_name="test-model") as monitor:
+            ts = int(logged_at.timestamp())
+            self.assertEqual(monitor._conn.execute("SELECT ts FROM token_usage").fetchone()[0], ts)
+            
+            report = monitor.get_report(start_date=ts, end_date=ts)
+            self.assertEqual(report["total_queries"], 1)
+            self.assertEqual(report["total_tokens"], 30)
+            self.assertEqual(report["recent_queries"][0]["timestamp"], logged_at.isoformat())
+    
     def test_reset_session(self):
         """Testa reset da sessão."""
         # Adicionar algumas queries